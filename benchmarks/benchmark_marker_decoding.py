@@ -0,0 +1,131 @@
+"""
+Benchmark parallel decoding of a region in `metadata.organize_marker_dict`.
+
+A synthetic Keyence-style region of compressed, tiled uint16 TIFFs (50 markers by default) is written to a temporary
+directory and loaded with every combination of `n_workers` and `maxworkers_per_file`. Every run must return the same
+images as the sequential one. TIFF decompression releases the GIL, so the speedup is bounded by the number of cores.
+
+Usage:
+    python benchmarks/benchmark_marker_decoding.py [--n-markers 50] [--size 2048] [--n-workers 1 2 4 8]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import tifffile
+from scipy import ndimage
+
+from pycodex import io, metadata
+
+
+def write_synthetic_region(
+    region_dir: str, n_markers: int = 50, size: int = 2048, compression: str = "zlib", seed: int = 0
+) -> None:
+    """
+    Write a synthetic Keyence-style region of compressed, tiled uint16 marker images.
+
+    Args:
+        region_dir (str): Directory of the region, named after it (e.g. "reg001").
+        n_markers (int, optional): Number of markers. Defaults to 50.
+        size (int, optional): Height and width of each image. Defaults to 2048.
+        compression (str, optional): TIFF compression. Defaults to "zlib".
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rng = np.random.default_rng(seed)
+    region = os.path.basename(region_dir)
+    os.makedirs(region_dir, exist_ok=True)
+    for i in range(n_markers):
+        # smooth background plus shot noise, compressible like real marker images
+        background = ndimage.zoom(rng.random((size // 64, size // 64)), 64, order=1) * 2000
+        im = rng.poisson(background).astype(np.uint16)
+        cycle, channel = i // 4 + 1, i % 4 + 1
+        marker_path = os.path.join(region_dir, f"{region}_cyc{cycle:03d}_ch{channel:03d}_Marker{i:02d}.tif")
+        tifffile.imwrite(marker_path, im, tile=(256, 256), compression=compression)
+
+
+def benchmark_marker_decoding(
+    n_markers: int = 50,
+    size: int = 2048,
+    n_workers_list: tuple[int, ...] = (1, 2, 4, 8),
+    maxworkers_per_file_list: tuple = (None, 1),
+    compression: str = "zlib",
+    n_repeats: int = 3,
+) -> pd.DataFrame:
+    """
+    Time `metadata.organize_marker_dict` on a synthetic region for each number of workers.
+
+    Args:
+        n_markers (int, optional): Number of markers. Defaults to 50.
+        size (int, optional): Height and width of each image. Defaults to 2048.
+        n_workers_list (tuple, optional): Values of `n_workers` to time. Defaults to (1, 2, 4, 8).
+        maxworkers_per_file_list (tuple, optional): Values of `maxworkers_per_file` to time. Defaults to (None, 1).
+        compression (str, optional): TIFF compression. Defaults to "zlib".
+        n_repeats (int, optional): Number of timed repeats; the best one is reported. Defaults to 3.
+
+    Returns:
+        pd.DataFrame: Best wall time, throughput and speedup over the sequential run for each combination.
+
+    Raises:
+        AssertionError: If a parallel run returns different images than the sequential one.
+    """
+    with tempfile.TemporaryDirectory() as marker_dir:
+        write_synthetic_region(os.path.join(marker_dir, "reg001"), n_markers, size, compression)
+        metadata_dict = io.organize_metadata_keyence(marker_dir)
+        marker_list = list(metadata_dict["reg001"]["marker"])
+        n_bytes = n_markers * size * size * 2
+
+        expected = None
+        results = []
+        for maxworkers_per_file in maxworkers_per_file_list:
+            for n_workers in n_workers_list:
+                seconds = []
+                for _ in range(n_repeats):
+                    start = time.perf_counter()
+                    marker_dict = metadata.organize_marker_dict(
+                        metadata_dict,
+                        "reg001",
+                        marker_list,
+                        n_workers=n_workers,
+                        maxworkers_per_file=maxworkers_per_file,
+                    )
+                    seconds.append(time.perf_counter() - start)
+                if expected is None:
+                    expected = marker_dict
+                for marker in marker_list:
+                    assert np.array_equal(marker_dict[marker], expected[marker]), marker
+                del marker_dict
+                results.append(
+                    {
+                        "n_workers": n_workers,
+                        "maxworkers_per_file": "auto" if maxworkers_per_file is None else maxworkers_per_file,
+                        "seconds": min(seconds),
+                        "MB/s": n_bytes / 1024**2 / min(seconds),
+                    }
+                )
+    results = pd.DataFrame(results)
+    results["speedup"] = results["seconds"].iloc[0] / results["seconds"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n-markers", type=int, default=50)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--n-workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--compression", default="zlib")
+    parser.add_argument("--n-repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s), {args.n_markers} markers of {args.size} x {args.size}, {args.compression}")
+    results = benchmark_marker_decoding(
+        n_markers=args.n_markers,
+        size=args.size,
+        n_workers_list=args.n_workers,
+        compression=args.compression,
+        n_repeats=args.n_repeats,
+    )
+    print(results.to_string(index=False, float_format="%.3f"))
@@ -0,0 +1,148 @@
+"""
+Check that `markerim.extract_cell_features` matches the `skimage.measure.regionprops` implementation it replaced.
+
+A synthetic mask (random blobs with gaps in the label numbering) and integer and float markers are summarized both
+ways, for the whole mask at once and for several `memory_budget_mb` values that split the mask into row strips or
+tiles. Integer markers must give identical tables. Float markers must give tables equal within float32 tolerance,
+since the reference sums float32 pixels in float32 while `np.bincount` accumulates in float64.
+
+Usage:
+    python benchmarks/check_extract_cell_features.py [--height 512] [--width 640] [--n-markers 6] [--seed 0]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import skimage.measure
+from scipy import ndimage
+
+from pycodex import markerim
+
+# None for the whole mask, then budgets giving row strips and, below one row (width x 24 bytes), column tiles
+MEMORY_BUDGETS_MB = [None, 0.5, 0.05, 0.01]
+
+
+def extract_cell_features_regionprops(
+    marker_dict: dict[str, np.ndarray], segmentation_mask: np.ndarray
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Reference implementation of `markerim.extract_cell_features` with `skimage.measure.regionprops`.
+
+    Args:
+        marker_dict (dict): Dictionary containing marker names as keys and corresponding images as values.
+        segmentation_mask (np.ndarray): Segmentation mask to extract single cell information.
+
+    Returns:
+        Tuple: DataFrames containing single cell data and size-scaled data.
+    """
+    marker_name = list(marker_dict)
+    marker_array = np.stack([marker_dict[marker] for marker in marker_name], axis=2)
+
+    props = skimage.measure.regionprops_table(segmentation_mask, properties=["label", "area", "centroid"])
+    props_df = pd.DataFrame(props)
+    props_df.columns = ["cellLabel", "cellSize", "Y_cent", "X_cent"]
+
+    stats = skimage.measure.regionprops(segmentation_mask)
+    sums = np.zeros((len(stats), len(marker_name)))
+    avgs = np.zeros((len(stats), len(marker_name)))
+    for i, region in enumerate(stats):
+        label_counts = [marker_array[coord[0], coord[1], :] for coord in region.coords]
+        sums[i] = np.sum(label_counts, axis=0)
+        avgs[i] = sums[i] / region.area
+
+    data = pd.concat([props_df, pd.DataFrame(sums, columns=marker_name)], axis=1)
+    data_scale_size = pd.concat([props_df, pd.DataFrame(avgs, columns=marker_name)], axis=1)
+    return data, data_scale_size
+
+
+def synthetic_segmentation(
+    height: int, width: int, n_markers: int, seed: int = 0
+) -> tuple[np.ndarray, dict[str, np.ndarray], dict[str, np.ndarray]]:
+    """
+    Create a synthetic segmentation mask with integer and float markers.
+
+    Args:
+        height (int): Height of the mask.
+        width (int): Width of the mask.
+        n_markers (int): Number of markers of each type.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        Tuple: Segmentation mask (int32), uint16 markers and float32 markers.
+    """
+    rng = np.random.default_rng(seed)
+    blobs = ndimage.gaussian_filter(rng.random((height, width)), sigma=2) > 0.5
+    segmentation_mask = skimage.measure.label(blobs).astype(np.int32)
+    # drop every third cell so the labels are not contiguous
+    segmentation_mask[np.isin(segmentation_mask, np.arange(3, segmentation_mask.max() + 1, 3))] = 0
+
+    int_markers = {f"int{i}": rng.integers(0, 65535, (height, width), dtype=np.uint16) for i in range(n_markers)}
+    float_markers = {f"float{i}": rng.random((height, width), dtype=np.float32) for i in range(n_markers)}
+    return segmentation_mask, int_markers, float_markers
+
+
+def check_extract_cell_features(height: int = 512, width: int = 640, n_markers: int = 6, seed: int = 0) -> pd.DataFrame:
+    """
+    Compare `markerim.extract_cell_features` with the regionprops reference for every memory budget.
+
+    Args:
+        height (int, optional): Height of the synthetic mask. Defaults to 512.
+        width (int, optional): Width of the synthetic mask. Defaults to 640.
+        n_markers (int, optional): Number of markers of each type. Defaults to 6.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: Marker type, memory budget, number of tiles and wall time of each run.
+
+    Raises:
+        AssertionError: If any table differs from the reference.
+    """
+    segmentation_mask, int_markers, float_markers = synthetic_segmentation(height, width, n_markers, seed)
+    results = []
+    for marker_type, marker_dict, check_exact in [("uint16", int_markers, True), ("float32", float_markers, False)]:
+        start = time.perf_counter()
+        expected = extract_cell_features_regionprops(marker_dict, segmentation_mask)
+        results.append(
+            {
+                "marker_type": marker_type,
+                "method": "regionprops",
+                "memory_budget_mb": None,
+                "n_tiles": 1,
+                "seconds": time.perf_counter() - start,
+            }
+        )
+        for memory_budget_mb in MEMORY_BUDGETS_MB:
+            start = time.perf_counter()
+            actual = markerim.extract_cell_features(marker_dict, segmentation_mask, memory_budget_mb=memory_budget_mb)
+            seconds = time.perf_counter() - start
+            for expected_df, actual_df in zip(expected, actual):
+                if check_exact:
+                    pd.testing.assert_frame_equal(actual_df, expected_df, check_exact=True)
+                else:
+                    pd.testing.assert_frame_equal(actual_df, expected_df, rtol=1e-5)
+            n_tiles = len(markerim._plan_feature_tiles(segmentation_mask.shape, 8 + 8 + 8, memory_budget_mb))
+            results.append(
+                {
+                    "marker_type": marker_type,
+                    "method": "bincount",
+                    "memory_budget_mb": memory_budget_mb,
+                    "n_tiles": n_tiles,
+                    "seconds": seconds,
+                }
+            )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--n-markers", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = check_extract_cell_features(args.height, args.width, args.n_markers, args.seed)
+    print(results.to_string(index=False))
+    print("extract_cell_features matches regionprops for all memory budgets")
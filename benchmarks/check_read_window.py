@@ -0,0 +1,78 @@
+"""
+Check that `io.imread_window` and `metadata.MarkerDict.read_window` match slicing the fully decoded image.
+
+Synthetic uint16 and float32 images are written in every layout handled by `io.read_page_window` (contiguous
+uncompressed, striped and tiled, uncompressed and compressed) in both byte orders, since ImageJ writes big-endian TIFFs
+by default. Windows inside the image, across chunk borders and clipped at the edges must all equal `im[y, x]`.
+
+Usage:
+    python benchmarks/check_read_window.py
+"""
+
+import itertools
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import tifffile
+
+from pycodex import io, metadata
+
+LAYOUTS = {
+    "contiguous": {},
+    "striped": {"rowsperstrip": 16},
+    "striped_zlib": {"rowsperstrip": 16, "compression": "zlib"},
+    "tiled": {"tile": (32, 32)},
+    "tiled_zlib_predictor": {"tile": (32, 32), "compression": "zlib", "predictor": 2},
+}
+BYTEORDERS = ["<", ">"]
+DTYPES = [np.uint16, np.float32]
+# (x_min, x_max, y_min, y_max)
+WINDOWS = [(3, 40, 3, 40), (0, 200, 0, 150), (31, 33, 15, 49), (180, 260, 120, 170), (50, 50, 10, 20)]
+
+
+def check_read_window(height: int = 150, width: int = 200, seed: int = 0) -> pd.DataFrame:
+    """
+    Compare windowed reads with slices of the full image for every layout, byte order and dtype.
+
+    Args:
+        height (int, optional): Height of the synthetic images. Defaults to 150.
+        width (int, optional): Width of the synthetic images. Defaults to 200.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: Layout, byte order, dtype and number of windows checked.
+
+    Raises:
+        AssertionError: If a window differs from the slice of the full image.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for (layout, kwargs), byteorder, dtype in itertools.product(LAYOUTS.items(), BYTEORDERS, DTYPES):
+            if "predictor" in kwargs and np.dtype(dtype).kind == "f":
+                # the floating-point predictor needs imagecodecs
+                continue
+            im = (rng.random((height, width)) * 60000).astype(dtype)
+            path = os.path.join(tmp_dir, f"{layout}_{'be' if byteorder == '>' else 'le'}_{np.dtype(dtype).name}.tif")
+            tifffile.imwrite(path, im, byteorder=byteorder, **kwargs)
+            marker_dict = metadata.MarkerDict({"marker": path}, max_cache_bytes=0)
+            for x_min, x_max, y_min, y_max in WINDOWS:
+                expected = im[y_min:y_max, x_min:x_max]
+                for actual in [
+                    io.imread_window(path, x_min, x_max, y_min, y_max),
+                    marker_dict.read_window("marker", x_min, x_max, y_min, y_max),
+                ]:
+                    assert actual.dtype == expected.dtype, (path, actual.dtype)
+                    assert np.array_equal(actual, expected), (path, (x_min, x_max, y_min, y_max))
+            results.append(
+                {"layout": layout, "byteorder": byteorder, "dtype": np.dtype(dtype).name, "n_windows": len(WINDOWS)}
+            )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    results = check_read_window()
+    print(results.to_string(index=False))
+    print("windowed reads match full reads for all layouts and byte orders")
@@ -1,11 +1,16 @@
+import argparse
 import tifffile
 import numpy as np 
 import cv2 
 import os 
 import logging
 import re
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from tqdm import tqdm
 from scipy.ndimage import map_coordinates
+from pycodex.io import read_page_window
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
@@ -25,6 +30,14 @@ CHANNEL_NAME = ['DAPI', 'CD20', 'Pax5', 'CD3', 'CD8', 'CD4', 'FoxP3', 'CD68', 'C
 OUTPUT_HEIGHT = 4161
 OUTPUT_WIDTH = 4144
 
+# registration runs on DAPI downsampled by this factor, read from the QPTIFF pyramid where possible
+REGISTRATION_FACTOR = 8
+# side of the full-resolution window used to refine the translation (e.g. 1024), None to skip the refinement;
+# can be set with --refine-window
+REFINE_WINDOW = None
+# coarse registration backend: None for SIFT with match images, or a key of REGISTRATION_BACKENDS
+REGISTRATION_BACKEND = None
+
 
 def list_files(directory: str):
     paths = []
@@ -34,21 +47,87 @@ def list_files(directory: str):
     return paths
 
 
-def read_dapi(path: str):
+class QptiffReader:
+    """
+    Keep one open handle on a QPTIFF and read windows of its channels (pages of the first series).
+
+    Only the tiles overlapping a window are read and decoded, so I/O scales with the window, not the slide.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tif = tifffile.TiffFile(path)
+
+    def level_factor(self, level):
+        # downsampling factor of a pyramid level relative to full resolution
+        levels = self._tif.series[0].levels
+        return int(round(levels[0].shape[-1] / levels[level].shape[-1]))
+
+    def find_level(self, factor):
+        # coarsest pyramid level whose factor divides the requested one
+        levels = range(len(self._tif.series[0].levels))
+        candidates = [level for level in levels if factor % self.level_factor(level) == 0]
+        return max(candidates, key=self.level_factor)
+
+    def read_window(self, page_index, x1, x2, y1, y2, level=0):
+        # coordinates are in pixels of the requested level
+        page = self._tif.series[0].levels[level].pages[page_index]
+        return read_page_window(self._tif, page, x1, x2, y1, y2)
+
+    def read_core(self, page_index, core_position):
+        x2, y2, x1, y1 = core_position
+        return self.read_window(page_index, x1, x2, y1, y2)
+
+    def read_core_downsampled(self, page_index, core_position, factor):
+        """
+        Read a core at 1/factor resolution from the coarsest matching pyramid level, area-averaging the rest.
+
+        Returns the image and the (x, y) offset such that its pixel (i, j) is centred at full-resolution core
+        coordinates (factor * j + offset_x, factor * i + offset_y).
+        """
+        x2, y2, x1, y1 = core_position
+        level = self.find_level(factor)
+        level_factor = self.level_factor(level)
+        lx1, ly1 = x1 // level_factor, y1 // level_factor
+        lx2, ly2 = -(-x2 // level_factor), -(-y2 // level_factor)
+        image = self.read_window(page_index, lx1, lx2, ly1, ly2, level=level)
+        # pyramid levels are area-averaged: level pixels are centred in the full-resolution pixels they cover
+        offset = np.array([lx1 * level_factor - x1, ly1 * level_factor - y1]) + (level_factor - 1) / 2
+        k = factor // level_factor
+        return downsample_mean(image, k), offset + (k - 1) / 2 * level_factor
+
+    def close(self):
+        self._tif.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_dapi(path: str, reader=None):
     cycle = re.search(r'(Cycle\d+)', path).group(1)
-    x2 = CORE_POSITION[cycle][0]
-    y2 = CORE_POSITION[cycle][1]
-    x1 = CORE_POSITION[cycle][2]
-    y1 = CORE_POSITION[cycle][3]
-    dapi = tifffile.TiffFile(path).series[0].pages[0].asarray()[y1:y2,x1:x2]
-    return dapi
+    if reader is None:
+        with QptiffReader(path) as reader:
+            return reader.read_core(0, CORE_POSITION[cycle])
+    return reader.read_core(0, CORE_POSITION[cycle])
+
 
+def downsample_mean(image, factor):
+    # area-averaging downsample (no aliasing, unlike striding); rows/columns that do not fill a block are dropped
+    if factor == 1:
+        return image.astype(np.float32)
+    height, width = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[: height * factor, : width * factor].reshape(height, factor, width, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
 
-def register_dapi(src, dst, sift, matcher, outname):
-    src = (src/256).astype('uint8')[::8, ::8]
-    dst = (dst/256).astype('uint8')[::8, ::8]
+
+def match_keypoints(src, dst, sift, matcher):
     kp1, des1 = sift.detectAndCompute(src, None)
     kp2, des2 = sift.detectAndCompute(dst, None)
+    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+        return kp1, kp2, [], np.empty((0, 1, 2), np.float32), np.empty((0, 1, 2), np.float32)
     matches = matcher.knnMatch(des1, des2, k = 2)
     good_matches = []
     for m, n in matches:
@@ -57,94 +136,317 @@ def register_dapi(src, dst, sift, matcher, outname):
     # Extract matched keypoints
     src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
     dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+    return kp1, kp2, good_matches, src_pts, dst_pts
+
+
+def register_dapi(src, dst, sift, matcher, outname, factor=8):
+    # full-resolution DAPI crops: area-average them down, then register at low resolution
+    offset = np.full(2, (factor - 1) / 2)
+    return register_dapi_coarse(
+        downsample_mean(src, factor), downsample_mean(dst, factor), sift, matcher, outname, factor, offset, offset
+    )
+
+
+class RegistrationBackend(ABC):
+    """
+    Interface of registration backends: register(src, dst) returns the 2 x 3 affine matrix mapping src to dst pixel
+    coordinates (None on failure) and a confidence between 0 and 1.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def register(self, src, dst):
+        ...
+
+
+class SiftBackend(RegistrationBackend):
+    """SIFT keypoints, ratio-test matching and a RANSAC partial affine (rotation, uniform scale, translation)."""
+
+    name = 'sift'
+
+    def __init__(self, nfeatures=1000):
+        self.nfeatures = nfeatures
+
+    def register(self, src, dst):
+        sift = cv2.SIFT_create(nfeatures=self.nfeatures)
+        matcher = cv2.BFMatcher()
+        _, _, good_matches, src_pts, dst_pts = match_keypoints(
+            (src / 256).astype('uint8'), (dst / 256).astype('uint8'), sift, matcher
+        )
+        if len(good_matches) < 3:
+            return None, 0.0
+        A, inliers = cv2.estimateAffinePartial2D(src_pts, dst_pts)
+        if A is None:
+            return None, 0.0
+        return A, float(inliers.mean())
+
+
+class PhaseCorrelationBackend(RegistrationBackend):
+    """
+    FFT phase correlation for translation, optionally preceded by a log-polar phase correlation of the magnitude
+    spectra for rotation and scale.
+
+    The confidence is the phase-correlation peak response (cv2.phaseCorrelate); below min_response the fallback
+    backend (SIFT by default, None to disable) is used instead.
+    """
+
+    name = 'phase'
+
+    def __init__(self, log_polar=False, min_response=0.1, fallback=None):
+        self.log_polar = log_polar
+        self.min_response = min_response
+        self.fallback = fallback if fallback is not None else SiftBackend()
+        if log_polar:
+            self.name = 'phase_logpolar'
+
+    @staticmethod
+    def _rotation_scale(src, dst):
+        # magnitude spectra ignore translation; rotation and scale become shifts in log-polar coordinates
+        height, width = src.shape
+        window = cv2.createHanningWindow((width, height), cv2.CV_32F)
+        # high-pass emphasis (Reddy and Chatterji) so low frequencies and the window do not dominate the correlation
+        fy, fx = np.meshgrid(np.linspace(-0.5, 0.5, height), np.linspace(-0.5, 0.5, width), indexing='ij')
+        x = np.cos(np.pi * fy) * np.cos(np.pi * fx)
+        highpass = (1 - x) * (2 - x)
+        magnitudes = [highpass * np.abs(np.fft.fftshift(np.fft.fft2(image * window))) for image in (src, dst)]
+        radius = min(height, width) / 2
+        center = (width / 2, height / 2)
+        flags = cv2.WARP_POLAR_LOG + cv2.INTER_LINEAR
+        polar = [
+            cv2.warpPolar(magnitude.astype(np.float32), (width, height), center, radius, flags)
+            for magnitude in magnitudes
+        ]
+        (d_log_radius, d_angle), response = cv2.phaseCorrelate(polar[0], polar[1])
+        # the magnitude spectrum is symmetric, so the angle is only known modulo 180 degrees
+        angle = (-d_angle * 360 / height + 90) % 180 - 90
+        scale = np.exp(-d_log_radius * np.log(radius) / width)
+        return angle, scale, response
+
+    def register(self, src, dst):
+        # phase correlation needs equal shapes: both images keep their top-left origin
+        height, width = min(src.shape[0], dst.shape[0]), min(src.shape[1], dst.shape[1])
+        src = np.ascontiguousarray(src[:height, :width], dtype=np.float32)
+        dst = np.ascontiguousarray(dst[:height, :width], dtype=np.float32)
+        window = cv2.createHanningWindow((width, height), cv2.CV_32F)
+
+        R = np.array([[1, 0, 0], [0, 1, 0]], dtype=np.float64)
+        rotated = src
+        if self.log_polar:
+            angle, scale, _ = self._rotation_scale(src, dst)
+            R = cv2.getRotationMatrix2D((width / 2, height / 2), angle, scale)
+            rotated = cv2.warpAffine(src, R, (width, height))
+
+        (dx, dy), response = cv2.phaseCorrelate(rotated, dst, window)
+        response = min(float(response), 1.0)
+        if response < self.min_response and self.fallback is not None:
+            logging.info(f'Phase correlation response {response:.3f}, falling back to {self.fallback.name}.')
+            return self.fallback.register(src, dst)
+        A = R.copy()
+        A[:, 2] += (dx, dy)
+        return A, response
+
+
+REGISTRATION_BACKENDS = {
+    'sift': SiftBackend,
+    'phase': PhaseCorrelationBackend,
+    'phase_logpolar': lambda: PhaseCorrelationBackend(log_polar=True),
+}
+
+
+def register_dapi_coarse(
+    src, dst, sift, matcher, outname, factor, src_offset=(0, 0), dst_offset=(0, 0), backend=None
+):
+    """
+    Estimate the full-resolution affine transform from src to dst core coordinates from 1/factor images.
+
+    src_offset and dst_offset locate the low-resolution pixel centres in full-resolution core coordinates, see
+    QptiffReader.read_core_downsampled. With a RegistrationBackend, it estimates the transform instead of the default
+    SIFT matching (which also saves the match image).
+    """
+    if backend is not None:
+        A, confidence = backend.register(src, dst)
+        logging.info(f'{backend.name} registration confidence: {confidence:.3f}')
+        if A is None:
+            raise RuntimeError(f'{backend.name} registration failed for {outname}')
+    else:
+        src = (src/256).astype('uint8')
+        dst = (dst/256).astype('uint8')
+        kp1, kp2, good_matches, src_pts, dst_pts = match_keypoints(src, dst, sift, matcher)
 
         # draw match image
-    match_img = cv2.drawMatches(img1 = src,
-                            keypoints1=kp1,
-                            img2 = dst,
-                            keypoints2=kp2,
-                            matches1to2=good_matches,
-                            outImg=None,
-                            flags = cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS)
-
-    tifffile.imwrite(f'registration_output/{outname}.png', match_img, compression='adobe_deflate')
-
-    # Compute affine transformation
-    A = cv2.estimateAffinePartial2D(src_pts, dst_pts)[0]
-    A[0,2] *= 8
-    A[1,2] *= 8
-    A_inverse = np.linalg.inv(np.vstack((A, [0,0,1])))
-    return A, A_inverse
+        match_img = cv2.drawMatches(img1 = src,
+                                keypoints1=kp1,
+                                img2 = dst,
+                                keypoints2=kp2,
+                                matches1to2=good_matches,
+                                outImg=None,
+                                flags = cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS)
 
-        
-def apply_affine_transformation(source_image, A_inverse, output_shape):
-    
-    dest_y, dest_x = np.indices(output_shape)
+        tifffile.imwrite(f'registration_output/{outname}.png', match_img, compression='adobe_deflate')
 
-    dest_coords = np.stack([dest_x.ravel(), dest_y.ravel(), np.ones(dest_x.size)])
+        A = cv2.estimateAffinePartial2D(src_pts, dst_pts)[0]
 
-    source_coords = A_inverse @ dest_coords
+    # Bring the transform to full resolution:
+    # full = factor * low + offset for both images, so the translation becomes factor * t + dst_offset - M @ src_offset
+    A[:, 2] = factor * A[:, 2] + np.asarray(dst_offset) - A[:, :2] @ np.asarray(src_offset)
+    A_inverse = np.linalg.inv(np.vstack((A, [0,0,1])))
+    return A, A_inverse
 
-    source_x = source_coords[0, :].reshape(output_shape)
 
-    source_y = source_coords[1, :].reshape(output_shape)
+def refine_translation(src_reader, dst_reader, src_core, dst_core, A, sift, matcher, window=1024, min_matches=10):
+    """
+    Refine the translation of a coarse transform at full resolution on a window x window patch at the core centre.
+
+    The src patch is warped into the dst patch with the coarse transform, and the residual shift is the median
+    displacement of the SIFT matches between the two patches. The coarse transform is kept if too few points match.
+    """
+    dst_x2, dst_y2, dst_x1, dst_y1 = dst_core
+    ox = (dst_x2 - dst_x1 - window) // 2
+    oy = (dst_y2 - dst_y1 - window) // 2
+    dst_patch = dst_reader.read_window(0, dst_x1 + ox, dst_x1 + ox + window, dst_y1 + oy, dst_y1 + oy + window)
+
+    # bounding box in src core coordinates of the patch mapped back through the coarse transform
+    A_inverse = np.linalg.inv(np.vstack((A, [0, 0, 1])))
+    corners = np.array([[ox, ox + window, ox, ox + window], [oy, oy, oy + window, oy + window], [1, 1, 1, 1]])
+    source_corners = (A_inverse @ corners)[:2]
+    bx, by = np.floor(source_corners.min(axis=1)).astype(int) - 2
+    ex, ey = np.ceil(source_corners.max(axis=1)).astype(int) + 2
+    src_x1, src_y1 = src_core[2], src_core[3]
+    src_region = src_reader.read_window(0, src_x1 + max(bx, 0), src_x1 + ex, src_y1 + max(by, 0), src_y1 + ey)
+    bx, by = max(bx, 0), max(by, 0)
+
+    # dst patch pixel -> dst core -> src core -> src region pixel
+    to_core = np.array([[1, 0, ox], [0, 1, oy], [0, 0, 1]], dtype=np.float64)
+    to_region = np.array([[1, 0, -bx], [0, 1, -by], [0, 0, 1]], dtype=np.float64)
+    src_patch = apply_affine_transformation(src_region, to_region @ A_inverse @ to_core, dst_patch.shape)
+
+    _, _, good_matches, src_pts, dst_pts = match_keypoints(
+        (src_patch / 256).astype('uint8'), (dst_patch / 256).astype('uint8'), sift, matcher
+    )
+    if len(good_matches) < min_matches:
+        logging.info(f'Refinement skipped: {len(good_matches)} matches.')
+        return A, A_inverse
+
+    shift = np.median((dst_pts - src_pts).reshape(-1, 2), axis=0)
+    logging.info(f'Refined translation by ({shift[0]:.2f}, {shift[1]:.2f}) pixels.')
+    A = A.copy()
+    A[:, 2] += shift
+    A_inverse = np.linalg.inv(np.vstack((A, [0, 0, 1])))
+    return A, A_inverse
 
-    transformed_image = map_coordinates(source_image, [source_y, source_x], order = 1, mode = 'constant', cval=0)
+        
+def _tile_source_coordinates(A_inverse, y_beg, y_end, x_beg, x_end):
+    # same homogeneous product as the full-grid version, restricted to one output tile
+    dest_y, dest_x = np.mgrid[y_beg:y_end, x_beg:x_end]
+    dest_coords = np.stack([dest_x.ravel(), dest_y.ravel(), np.ones(dest_x.size)])
+    source_coords = A_inverse @ dest_coords
+    source_x = source_coords[0, :].reshape(dest_x.shape)
+    source_y = source_coords[1, :].reshape(dest_x.shape)
+    return source_y, source_x
 
-    transformed_image = np.clip(transformed_image, 0, 65535).astype(np.uint16)
 
-    return transformed_image
+def apply_affine_transformation_stack(source_stack, A_inverse, output_shape, tile_size=512, n_workers=None):
+    """
+    Warp every channel of a (C, Y, X) stack with one inverse affine matrix (bilinear, zero outside the source).
 
+    The output is processed in tiles of tile_size x tile_size: source coordinates are computed once per tile and
+    shared by all channels, so the temporaries are a few MB instead of several full-size float64 grids. Tiles are
+    warped on n_workers threads (map_coordinates releases the GIL) into a preallocated (C, Y, X) uint16 output.
+    """
+    output = np.empty((len(source_stack),) + tuple(output_shape), dtype=np.uint16)
+    tiles = [
+        (y_beg, min(y_beg + tile_size, output_shape[0]), x_beg, min(x_beg + tile_size, output_shape[1]))
+        for y_beg in range(0, output_shape[0], tile_size)
+        for x_beg in range(0, output_shape[1], tile_size)
+    ]
 
-def main():
-    qptiff_paths = [i for i in list_files(PATH_TO_QPTIFF) if '.raw.qptiff' in i]
-    
-    DAPI_list = []
+    def warp_tile(tile):
+        y_beg, y_end, x_beg, x_end = tile
+        source_coords = _tile_source_coordinates(A_inverse, y_beg, y_end, x_beg, x_end)
+        for channel, source_image in enumerate(source_stack):
+            transformed_tile = map_coordinates(source_image, source_coords, order=1, mode='constant', cval=0)
+            output[channel, y_beg:y_end, x_beg:x_end] = np.clip(transformed_tile, 0, 65535)
 
-    for path in qptiff_paths:
-        logging.info(f'Reading DAPI from {path}.')
-        dapi = read_dapi(path)
-        DAPI_list.append(dapi)
-    logging.info(f'Finished Reading all DAPI.')
+    with ThreadPoolExecutor(max_workers=n_workers or os.cpu_count()) as executor:
+        list(executor.map(warp_tile, tiles))
 
-    image_stack = []
+    return output
 
-    image_stack.append(DAPI_list[0])
 
-    image_stack.append(tifffile.TiffFile(qptiff_paths[0]).series[0].pages[1].asarray()[25000:29161, 16114:20258])
+def apply_affine_transformation(source_image, A_inverse, output_shape, tile_size=512, n_workers=None):
+    """
+    Warp an image with an inverse affine matrix (bilinear, zero outside the source) into a uint16 image.
 
-    image_stack.append(tifffile.TiffFile(qptiff_paths[0]).series[0].pages[3].asarray()[25000:29161, 16114:20258])
+    See apply_affine_transformation_stack, which warps all channels of a cycle in one pass.
+    """
+    return apply_affine_transformation_stack(source_image[np.newaxis], A_inverse, output_shape, tile_size, n_workers)[0]
 
-    #logging.info(f'{image_stack[0].shape} \n {image_stack[1].shape} \n {image_stack[2].shape} \n')
 
-    for i in tqdm(range(4)):
-        sift = cv2.SIFT_create(nfeatures=1000)
-        matcher = cv2.BFMatcher()
-        logging.info(f'Calculating affine transformation matrix from cycle{i+2} to cycle1...')
-        A, A_inverse = register_dapi(DAPI_list[i + 1], DAPI_list[0], sift, matcher, f'cycle{i+2}_to_cycle1')
-        logging.info(f'Finished calculation')
+def main(refine_window=REFINE_WINDOW):
+    qptiff_paths = [i for i in list_files(PATH_TO_QPTIFF) if '.raw.qptiff' in i]
+    
+    # one open handle per QPTIFF, shared by all reads of the file and closed even if a step fails
+    with ExitStack() as stack:
+        readers = [stack.enter_context(QptiffReader(path)) for path in qptiff_paths]
+        backend = REGISTRATION_BACKENDS[REGISTRATION_BACKEND]() if REGISTRATION_BACKEND else None
+
+        # full-resolution DAPI is only needed for the reference cycle; registration reads low-resolution levels
+        dst_core = CORE_POSITION['Cycle1']
+        logging.info(f'Reading DAPI from {qptiff_paths[0]}.')
+        dst_small, dst_offset = readers[0].read_core_downsampled(0, dst_core, REGISTRATION_FACTOR)
+
+        image_stack = []
+
+        image_stack.append(read_dapi(qptiff_paths[0], readers[0]))
+
+        image_stack.append(readers[0].read_window(1, 16114, 20258, 25000, 29161))
+
+        image_stack.append(readers[0].read_window(3, 16114, 20258, 25000, 29161))
+
+        #logging.info(f'{image_stack[0].shape} \n {image_stack[1].shape} \n {image_stack[2].shape} \n')
+
+        for i in tqdm(range(4)):
+            sift = cv2.SIFT_create(nfeatures=1000)
+            matcher = cv2.BFMatcher()
+            src_core = CORE_POSITION[f'Cycle{i+2}']
+            logging.info(f'Reading DAPI from {qptiff_paths[i+1]}.')
+            src_small, src_offset = readers[i + 1].read_core_downsampled(0, src_core, REGISTRATION_FACTOR)
+            logging.info(f'Calculating affine transformation matrix from cycle{i+2} to cycle1...')
+            A, A_inverse = register_dapi_coarse(
+                src_small,
+                dst_small,
+                sift,
+                matcher,
+                f'cycle{i+2}_to_cycle1',
+                REGISTRATION_FACTOR,
+                src_offset,
+                dst_offset,
+                backend,
+            )
+            if refine_window:
+                A, A_inverse = refine_translation(
+                    readers[i + 1], readers[0], src_core, dst_core, A, sift, matcher, refine_window
+                )
+            logging.info(f'Finished calculation')
         
-        cycle_file = qptiff_paths[i+1]
-        x2 = CORE_POSITION[f'Cycle{i+2}'][0]
-        y2 = CORE_POSITION[f'Cycle{i+2}'][1]
-        x1 = CORE_POSITION[f'Cycle{i+2}'][2]
-        y1 = CORE_POSITION[f'Cycle{i+2}'][3]
-        cy3 = tifffile.TiffFile(cycle_file).series[0].pages[1].asarray()[y1:y2,x1:x2]
-        cy5 = tifffile.TiffFile(cycle_file).series[0].pages[3].asarray()[y1:y2,x1:x2]
-        logging.info(f'Finished loading cy3 and cy5 of the cycle')
+            cy3 = readers[i + 1].read_core(1, src_core)
+            cy5 = readers[i + 1].read_core(3, src_core)
+            logging.info(f'Finished loading cy3 and cy5 of the cycle')
 
 
         
-        # Apply affine transformation using cv2.warpAffine
-        cy3_out = apply_affine_transformation(cy3, A_inverse, (OUTPUT_HEIGHT, OUTPUT_WIDTH))
-        cy5_out = apply_affine_transformation(cy5, A_inverse, (OUTPUT_HEIGHT, OUTPUT_WIDTH))
-        logging.info(f'Finished transforming cy3 and cy5.')
-        tifffile.imwrite(f'registration_output/{i+2}_cy3.tiff', cy3_out)
-        tifffile.imwrite(f'registration_output/{i+2}_cy5.tiff', cy5_out)
-        #logging.info(f'cy3 shape: {cy3_out.shape}; cy5 shape: {cy5_out.shape}')
+            # Apply affine transformation to all channels of the cycle at once
+            cy3_out, cy5_out = apply_affine_transformation_stack(
+                np.stack([cy3, cy5]), A_inverse, (OUTPUT_HEIGHT, OUTPUT_WIDTH)
+            )
+            logging.info(f'Finished transforming cy3 and cy5.')
+            tifffile.imwrite(f'registration_output/{i+2}_cy3.tiff', cy3_out)
+            tifffile.imwrite(f'registration_output/{i+2}_cy5.tiff', cy5_out)
+            #logging.info(f'cy3 shape: {cy3_out.shape}; cy5 shape: {cy5_out.shape}')
         
-        image_stack.append(cy3_out)
-        image_stack.append(cy5_out)
+            image_stack.append(cy3_out)
+            image_stack.append(cy5_out)
 
     aligned_check = np.stack(image_stack, axis=0)
 
@@ -171,7 +473,13 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Align the channels of all cycles to the DAPI of the first cycle.')
+    parser.add_argument(
+        '--refine-window', type=int, default=REFINE_WINDOW,
+        help='side of the full-resolution window used to refine the translation (e.g. 1024); off by default',
+    )
+    args = parser.parse_args()
+    main(refine_window=args.refine_window)
 
     
 
@@ -1,7 +1,104 @@
+import json
 import os
 import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Callable, Optional
 
+import numpy as np
 import pandas as pd
+import tifffile
+
+########################################################################################################################
+# metadata dictionary
+########################################################################################################################
+
+
+class MetadataDict(dict):
+    """
+    Dictionary of region names to metadata DataFrames, indexed by marker.
+
+    Behaves like the plain `dict[str, pd.DataFrame]` returned before, and additionally keeps a per-region
+    marker -> rows index (path and the other columns of each row), built once on first use. Lookups of a marker in a
+    region are then O(1) instead of a scan of the DataFrame. Replacing the DataFrame of a region rebuilds its index;
+    DataFrames modified in place must be reassigned (`metadata_dict[region] = metadata_df`) to be re-indexed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._index = {}
+
+    def marker_index(self, region: str) -> dict[str, list[dict]]:
+        """
+        Get the marker index of a region.
+
+        Args:
+            region (str): Region name.
+
+        Returns:
+            dict: Marker names as keys and lists of metadata rows (as dictionaries) as values, in DataFrame order.
+        """
+        metadata_df = self[region]
+        cached = self._index.get(region)
+        if cached is None or cached[0] is not metadata_df:
+            index = {}
+            for row in metadata_df.to_dict("records"):
+                index.setdefault(row["marker"], []).append(row)
+            cached = (metadata_df, index)
+            self._index[region] = cached
+        return cached[1]
+
+    def marker_info(self, region: str, marker: str) -> dict:
+        """
+        Get the metadata row of a marker in a region.
+
+        Args:
+            region (str): Region name.
+            marker (str): Marker name.
+
+        Returns:
+            dict: Metadata row of the marker (path and the other DataFrame columns).
+
+        Raises:
+            KeyError: If the marker is not in the region.
+            ValueError: If the marker is duplicated in the region.
+        """
+        rows = self.marker_index(region).get(marker)
+        if rows is None:
+            raise KeyError(f"Marker '{marker}' not found in region '{region}'")
+        if len(rows) > 1:
+            raise ValueError(f"Marker '{marker}' is duplicated in region '{region}': {[row['path'] for row in rows]}")
+        return rows[0]
+
+    def marker_path(self, region: str, marker: str) -> str:
+        """
+        Get the path of a marker in a region, see `marker_info`.
+
+        Args:
+            region (str): Region name.
+            marker (str): Marker name.
+
+        Returns:
+            str: Path to the marker image file.
+        """
+        return self.marker_info(region, marker)["path"]
+
+
+def as_metadata_dict(metadata_dict: dict[str, pd.DataFrame]) -> MetadataDict:
+    """
+    Wrap a plain metadata dictionary into a `MetadataDict`, or return it unchanged if it already is one.
+
+    Args:
+        metadata_dict (dict): Dictionary containing region names as keys and metadata DataFrames as values.
+
+    Returns:
+        MetadataDict: Indexed metadata dictionary sharing the same DataFrames.
+    """
+    if isinstance(metadata_dict, MetadataDict):
+        return metadata_dict
+    return MetadataDict(metadata_dict)
+
 
 ########################################################################################################################
 # rename marker
@@ -83,7 +180,8 @@ def get_marker_metadata_fusion(region_dir: str) -> tuple[str, pd.DataFrame]:
     marker_paths = []
     for root, dirs, files in os.walk(region_dir):
         for file in files:
-            marker_paths.append(os.path.join(root, file))
+            if file.lower().endswith((".tif", ".tiff")):
+                marker_paths.append(os.path.join(root, file))
     metadata_df = pd.DataFrame(
         [parse_marker_fusion(path) for path in marker_paths],
         columns=["path", "region", "marker"],
@@ -92,21 +190,39 @@ def get_marker_metadata_fusion(region_dir: str) -> tuple[str, pd.DataFrame]:
     return region, metadata_df
 
 
-def organize_metadata_fusion(marker_dir: str) -> dict[str, pd.DataFrame]:
+def organize_metadata_fusion(
+    marker_dir: str,
+    catalogue_path: Optional[str] = None,
+    read_headers: bool = False,
+    n_workers: int = 8,
+) -> MetadataDict:
     """
     Organize metadata for all regions in the final directory.
 
     Args:
         marker_dir (str): Directory containing subdirectories which contain marker files for a specific region.
+        catalogue_path (str, optional): Path to a `MetadataCatalogue` SQLite file caching the parsed metadata, so
+            that only region directories changed since the last call are scanned again. Defaults to None, which
+            scans every region directory.
+        read_headers (bool, optional): Whether to add TIFF header columns (shape, dtype, pixel size, compression,
+            tiling; see `read_tiff_headers`) without reading pixel data. Defaults to False.
+        n_workers (int, optional): Number of headers read concurrently when `read_headers` is True. Defaults to 8.
 
     Returns:
-        dict: Dictionary containing region names as keys and metadata DataFrames as values.
+        MetadataDict: Dictionary containing region names as keys and metadata DataFrames as values.
     """
-    region_dirs = [os.path.join(marker_dir, subdir) for subdir in os.listdir(marker_dir)]
-    metadata_dict = {}
-    for region_dir in region_dirs:
-        region, metadata_df = get_marker_metadata_fusion(region_dir)
-        metadata_dict[region] = metadata_df
+    if catalogue_path is not None:
+        metadata_dict = MetadataCatalogue(catalogue_path).organize_metadata(
+            marker_dir, "fusion", get_marker_metadata_fusion
+        )
+    else:
+        region_dirs = [os.path.join(marker_dir, subdir) for subdir in os.listdir(marker_dir)]
+        metadata_dict = MetadataDict()
+        for region_dir in region_dirs:
+            region, metadata_df = get_marker_metadata_fusion(region_dir)
+            metadata_dict[region] = metadata_df
+    if read_headers:
+        metadata_dict = read_tiff_headers(metadata_dict, n_workers=n_workers, catalogue_path=catalogue_path)
     return metadata_dict
 
 
@@ -145,7 +261,8 @@ def get_marker_metadata_keyence(region_dir: str) -> tuple[str, pd.DataFrame]:
     marker_paths = []
     for root, dirs, files in os.walk(region_dir):
         for file in files:
-            marker_paths.append(os.path.join(root, file))
+            if file.lower().endswith((".tif", ".tiff")):
+                marker_paths.append(os.path.join(root, file))
     metadata_df = pd.DataFrame(
         [parse_marker_keyence(path) for path in marker_paths],
         columns=["path", "region", "cycle", "channel", "marker"],
@@ -154,19 +271,405 @@ def get_marker_metadata_keyence(region_dir: str) -> tuple[str, pd.DataFrame]:
     return region, metadata_df
 
 
-def organize_metadata_keyence(marker_dir: str) -> dict[str, pd.DataFrame]:
+def organize_metadata_keyence(
+    marker_dir: str,
+    catalogue_path: Optional[str] = None,
+    read_headers: bool = False,
+    n_workers: int = 8,
+) -> MetadataDict:
     """
     Keyence: Organize metadata for all regions in the final directory.
 
     Args:
         marker_dir (str): Directory containing subdirectories which contain marker files for a specific region.
+        catalogue_path (str, optional): Path to a `MetadataCatalogue` SQLite file caching the parsed metadata, so
+            that only region directories changed since the last call are scanned again. Defaults to None, which
+            scans every region directory.
+        read_headers (bool, optional): Whether to add TIFF header columns (shape, dtype, pixel size, compression,
+            tiling; see `read_tiff_headers`) without reading pixel data. Defaults to False.
+        n_workers (int, optional): Number of headers read concurrently when `read_headers` is True. Defaults to 8.
 
     Returns:
-        dict: Dictionary containing region names as keys and metadata DataFrames as values.
+        MetadataDict: Dictionary containing region names as keys and metadata DataFrames as values.
     """
-    region_dirs = [os.path.join(marker_dir, subdir) for subdir in os.listdir(marker_dir)]
-    metadata_dict = {}
-    for region_dir in region_dirs:
-        region, metadata_df = get_marker_metadata_keyence(region_dir)
-        metadata_dict[region] = metadata_df
+    if catalogue_path is not None:
+        metadata_dict = MetadataCatalogue(catalogue_path).organize_metadata(
+            marker_dir, "keyence", get_marker_metadata_keyence
+        )
+    else:
+        region_dirs = [os.path.join(marker_dir, subdir) for subdir in os.listdir(marker_dir)]
+        metadata_dict = MetadataDict()
+        for region_dir in region_dirs:
+            region, metadata_df = get_marker_metadata_keyence(region_dir)
+            metadata_dict[region] = metadata_df
+    if read_headers:
+        metadata_dict = read_tiff_headers(metadata_dict, n_workers=n_workers, catalogue_path=catalogue_path)
     return metadata_dict
+
+
+########################################################################################################################
+# catalogue
+########################################################################################################################
+
+
+class MetadataCatalogue:
+    """
+    Persistent SQLite catalogue of parsed marker metadata, one entry per region directory.
+
+    Each entry stores the metadata DataFrame of a region directory together with the modification times of the
+    directory and its subdirectories. Adding, removing or renaming a file changes the modification time of its
+    directory, so a region is scanned again only when one of its directories changed; unchanged regions cost one
+    `stat` per directory instead of a listing and a regex per file.
+
+    TIFF headers harvested by `read_tiff_headers` are stored per file, keyed by file size and modification time.
+
+    Args:
+        path (str): Path to the SQLite file, created if it does not exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as con, con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS regions ("
+                "scanner TEXT, region_dir TEXT, dir_mtimes TEXT, region TEXT, metadata TEXT, "
+                "PRIMARY KEY (scanner, region_dir))"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS headers (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, header TEXT)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    @staticmethod
+    def _dir_mtimes(region_dir: str) -> dict[str, float]:
+        return {root: os.stat(root).st_mtime for root, _, _ in os.walk(region_dir)}
+
+    @staticmethod
+    def _is_unchanged(dir_mtimes: dict[str, float]) -> bool:
+        try:
+            return all(os.stat(path).st_mtime == mtime for path, mtime in dir_mtimes.items())
+        except OSError:
+            return False
+
+    @staticmethod
+    def _dump_df(metadata_df: pd.DataFrame) -> str:
+        return json.dumps({"columns": list(metadata_df.columns), "data": metadata_df.values.tolist()})
+
+    @staticmethod
+    def _load_df(metadata: str) -> pd.DataFrame:
+        metadata = json.loads(metadata)
+        return pd.DataFrame(metadata["data"], columns=metadata["columns"])
+
+    def organize_metadata(
+        self,
+        marker_dir: str,
+        scanner: str,
+        get_marker_metadata: Callable[[str], tuple[str, pd.DataFrame]],
+    ) -> MetadataDict:
+        """
+        Organize metadata for all regions in a directory, scanning only region directories that changed.
+
+        Args:
+            marker_dir (str): Directory containing subdirectories which contain marker files for a specific region.
+            scanner (str): Name of the scanner format (e.g. "keyence"), used to keep entries of different parsers apart.
+            get_marker_metadata (Callable): Function returning the region name and metadata DataFrame of a region
+                directory, e.g. `get_marker_metadata_keyence`.
+
+        Returns:
+            MetadataDict: Dictionary containing region names as keys and metadata DataFrames as values.
+        """
+        region_dirs = [os.path.join(marker_dir, subdir) for subdir in os.listdir(marker_dir)]
+        with closing(self._connect()) as con:
+            rows = con.execute(
+                "SELECT region_dir, dir_mtimes, region, metadata FROM regions WHERE scanner = ? AND region_dir IN "
+                f"({', '.join('?' * len(region_dirs))})",
+                [scanner, *region_dirs],
+            ).fetchall()
+        entries = {row[0]: (json.loads(row[1]), row[2], row[3]) for row in rows}
+
+        metadata_dict = MetadataDict()
+        updates = []
+        for region_dir in region_dirs:
+            entry = entries.get(region_dir)
+            if entry is not None and self._is_unchanged(entry[0]):
+                metadata_dict[entry[1]] = self._load_df(entry[2])
+                continue
+            # record the modification times before scanning so that changes made during the scan are picked up later
+            dir_mtimes = self._dir_mtimes(region_dir)
+            region, metadata_df = get_marker_metadata(region_dir)
+            metadata_dict[region] = metadata_df
+            updates.append((scanner, region_dir, json.dumps(dir_mtimes), region, self._dump_df(metadata_df)))
+
+        if updates:
+            with closing(self._connect()) as con, con:
+                con.executemany("INSERT OR REPLACE INTO regions VALUES (?, ?, ?, ?, ?)", updates)
+        return metadata_dict
+
+    def get_headers(self, paths: list[str]) -> dict[str, dict]:
+        """
+        Get the stored TIFF headers of files that did not change since they were stored.
+
+        Args:
+            paths (list): Paths to the TIFF files.
+
+        Returns:
+            dict: Paths as keys and headers (see `read_tiff_header`) as values, for up-to-date files only.
+        """
+        with closing(self._connect()) as con:
+            rows = con.execute("SELECT path, size, mtime, header FROM headers").fetchall()
+        stored = {row[0]: row[1:] for row in rows}
+        headers = {}
+        for path in paths:
+            if path not in stored:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            size, mtime, header = stored[path]
+            if stat.st_size == size and stat.st_mtime == mtime:
+                headers[path] = json.loads(header)
+        return headers
+
+    def put_headers(self, headers: dict[str, dict]) -> None:
+        """
+        Store TIFF headers, keyed by the current size and modification time of each file.
+
+        Args:
+            headers (dict): Paths as keys and headers (see `read_tiff_header`) as values.
+        """
+        rows = []
+        for path, header in headers.items():
+            stat = os.stat(path)
+            rows.append((path, stat.st_size, stat.st_mtime, json.dumps(header)))
+        with closing(self._connect()) as con, con:
+            con.executemany("INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?)", rows)
+
+
+########################################################################################################################
+# read marker images
+########################################################################################################################
+
+
+def imread_marker(marker_path: str, mmap: bool = False, maxworkers: Optional[int] = None) -> np.ndarray:
+    """
+    Read a marker image, optionally memory-mapping it instead of decoding it.
+
+    With `mmap`, uncompressed TIFFs whose image data is contiguous in the file are memory-mapped read-only: no heap copy
+    is made, crops of the image are page-cache-backed views, and processes reading the same file share physical
+    pages. Compressed or otherwise non-mappable TIFFs fall back to decoding with `tifffile.imread`.
+
+    Args:
+        marker_path (str): Path to the marker image file.
+        mmap (bool, optional): Whether to memory-map eligible TIFFs. Defaults to False.
+        maxworkers (int, optional): Maximum number of threads decoding the tiles or strips of the file, passed to
+            `tifffile.imread`. Defaults to None, which lets tifffile decide.
+
+    Returns:
+        np.ndarray: Marker image (a read-only `np.memmap` if memory-mapped).
+    """
+    if mmap:
+        with tifffile.TiffFile(marker_path) as tif:
+            memmappable = len(tif.pages) == 1 and tif.pages[0].is_memmappable
+        if memmappable:
+            return tifffile.memmap(marker_path, mode="r")
+    return tifffile.imread(marker_path, maxworkers=maxworkers)
+
+
+def read_page_window(
+    tif: tifffile.TiffFile, page: tifffile.TiffPage, x_min: int, x_max: int, y_min: int, y_max: int
+) -> np.ndarray:
+    """
+    Read a rectangular window of a page of an open TIFF file, decoding only the tiles or strips that overlap it.
+
+    Uncompressed contiguous pages are memory-mapped and sliced. Tiled and striped pages (compressed or not) have only
+    the overlapping segments read and decoded. Multi-sample pages fall back to a full read of the page.
+    The window is clipped to the page like a NumPy slice `im[y_min:y_max, x_min:x_max]`.
+
+    Args:
+        tif (tifffile.TiffFile): Open TIFF file.
+        page (tifffile.TiffPage or tifffile.TiffFrame): Page of `tif`, for example a page of a series or of a pyramid
+            level.
+        x_min (int): Minimum x-coordinate of the window.
+        x_max (int): Maximum x-coordinate of the window (exclusive).
+        y_min (int): Minimum y-coordinate of the window.
+        y_max (int): Maximum y-coordinate of the window (exclusive).
+
+    Returns:
+        np.ndarray: Window of the page.
+    """
+    if isinstance(page, tifffile.TiffFrame):
+        page = page.aspage()
+    if page.samplesperpixel > 1 or page.imagedepth > 1:
+        return page.asarray()[y_min:y_max, x_min:x_max].copy()
+
+    height, width = page.shape
+    y_min, y_max, _ = slice(y_min, y_max).indices(height)
+    x_min, x_max, _ = slice(x_min, x_max).indices(width)
+    window = np.zeros((max(y_max - y_min, 0), max(x_max - x_min, 0)), dtype=page.dtype)
+    if window.size == 0:
+        return window
+
+    if page.is_memmappable:
+        # page.dtype is native; the file may be big-endian (e.g. written by ImageJ)
+        dtype = np.dtype(tif.byteorder + page.dtype.char)
+        im = np.memmap(tif.filehandle.path, dtype=dtype, mode="r", offset=page.dataoffsets[0], shape=page.shape)
+        window[:] = im[y_min:y_max, x_min:x_max]
+        return window
+
+    chunk_height, chunk_width = page.chunks[:2] if len(page.chunks) > 1 else (page.chunks[0], width)
+    n_chunk_cols = page.chunked[1] if len(page.chunked) > 1 else 1
+    indices = [
+        chunk_row * n_chunk_cols + chunk_col
+        for chunk_row in range(y_min // chunk_height, (y_max - 1) // chunk_height + 1)
+        for chunk_col in range(x_min // chunk_width, (x_max - 1) // chunk_width + 1)
+    ]
+    segments = tif.filehandle.read_segments(
+        [page.dataoffsets[i] for i in indices],
+        [page.databytecounts[i] for i in indices],
+        indices=indices,
+        sort=True,
+    )
+    for data, index in segments:
+        segment, (_, _, top, left, _), _ = page.decode(data, index, jpegtables=page.jpegtables)
+        segment = segment[0, :, :, 0]
+        # overlap of the decoded segment with the window, in image coordinates
+        y0, y1 = max(top, y_min), min(top + segment.shape[0], y_max)
+        x0, x1 = max(left, x_min), min(left + segment.shape[1], x_max)
+        overlap = segment[y0 - top : y1 - top, x0 - left : x1 - left]
+        window[y0 - y_min : y1 - y_min, x0 - x_min : x1 - x_min] = overlap
+    return window
+
+
+def imread_window(marker_path: str, x_min: int, x_max: int, y_min: int, y_max: int) -> np.ndarray:
+    """
+    Read a rectangular window of a marker image, decoding only the tiles or strips that overlap it.
+
+    See `read_page_window`. Multi-page images fall back to a full read.
+
+    Args:
+        marker_path (str): Path to the marker image file.
+        x_min (int): Minimum x-coordinate of the window.
+        x_max (int): Maximum x-coordinate of the window (exclusive).
+        y_min (int): Minimum y-coordinate of the window.
+        y_max (int): Maximum y-coordinate of the window (exclusive).
+
+    Returns:
+        np.ndarray: Window of the marker image.
+    """
+    with tifffile.TiffFile(marker_path) as tif:
+        if len(tif.pages) > 1:
+            return tif.asarray()[y_min:y_max, x_min:x_max].copy()
+        return read_page_window(tif, tif.pages[0], x_min, x_max, y_min, y_max)
+
+
+########################################################################################################################
+# read tiff headers
+########################################################################################################################
+
+HEADER_COLUMNS = [
+    "width",
+    "height",
+    "dtype",
+    "pixel_width_um",
+    "pixel_height_um",
+    "compression",
+    "tile_width",
+    "tile_height",
+]
+
+
+def get_pixel_size_um(page: tifffile.TiffPage) -> tuple[float, float]:
+    """
+    Get the pixel size of a TIFF page in micrometers from its resolution tags.
+
+    Args:
+        page (tifffile.TiffPage): TIFF page.
+
+    Returns:
+        tuple: Pixel width and pixel height in micrometers.
+    """
+    # Get resolution unit
+    res_unit = page.tags.get("ResolutionUnit", None)
+    if res_unit is None or res_unit.value == 2:  # 2 means inch
+        unit_scale = 25400  # Convert inches to micrometers
+    elif res_unit.value == 3:  # 3 means centimeter
+        unit_scale = 10000  # Convert centimeters to micrometers
+    else:
+        raise ValueError("Unsupported resolution unit")
+
+    # Get resolution values
+    x_res = page.tags["XResolution"].value[0] / page.tags["XResolution"].value[1]
+    y_res = page.tags["YResolution"].value[0] / page.tags["YResolution"].value[1]
+    return unit_scale / x_res, unit_scale / y_res
+
+
+def read_tiff_header(tiff_path: str) -> dict:
+    """
+    Read the header of a TIFF file without decoding any pixel data.
+
+    Args:
+        tiff_path (str): Path to the TIFF file.
+
+    Returns:
+        dict: Values of `HEADER_COLUMNS` for the first page: width and height in pixels, NumPy dtype string, pixel
+        width and height in micrometers (None if the resolution tags are missing or unsupported), compression name
+        and tile width and height (None for striped images).
+    """
+    with tifffile.TiffFile(tiff_path) as tif:
+        page = tif.pages[0]
+        try:
+            pixel_width_um, pixel_height_um = get_pixel_size_um(page)
+        except (KeyError, ValueError, ZeroDivisionError):
+            pixel_width_um, pixel_height_um = None, None
+        return {
+            "width": page.imagewidth,
+            "height": page.imagelength,
+            "dtype": page.dtype.str if page.dtype is not None else None,
+            "pixel_width_um": pixel_width_um,
+            "pixel_height_um": pixel_height_um,
+            "compression": page.compression.name,
+            "tile_width": page.tilewidth if page.is_tiled else None,
+            "tile_height": page.tilelength if page.is_tiled else None,
+        }
+
+
+def read_tiff_headers(
+    metadata_dict: dict[str, pd.DataFrame],
+    n_workers: int = 8,
+    catalogue_path: Optional[str] = None,
+) -> MetadataDict:
+    """
+    Add TIFF header columns (`HEADER_COLUMNS`) to the metadata of every region, reading only the file headers.
+
+    Headers are read concurrently on a thread pool, which mostly hides the latency of network-mounted storage. With a
+    catalogue, headers of files unchanged since the last call are taken from it and new headers are stored in it.
+
+    Args:
+        metadata_dict (dict): Dictionary containing region names as keys and metadata DataFrames as values.
+        n_workers (int, optional): Number of headers read concurrently. Defaults to 8.
+        catalogue_path (str, optional): Path to a `MetadataCatalogue` SQLite file. Defaults to None.
+
+    Returns:
+        MetadataDict: Dictionary containing region names as keys and metadata DataFrames with the header columns
+        as values.
+    """
+    paths = [path for metadata_df in metadata_dict.values() for path in metadata_df["path"]]
+    catalogue = MetadataCatalogue(catalogue_path) if catalogue_path is not None else None
+    headers = catalogue.get_headers(paths) if catalogue is not None else {}
+
+    missing_paths = list(dict.fromkeys(path for path in paths if path not in headers))
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        new_headers = dict(zip(missing_paths, executor.map(read_tiff_header, missing_paths)))
+    if catalogue is not None and new_headers:
+        catalogue.put_headers(new_headers)
+    headers.update(new_headers)
+
+    header_dict = MetadataDict()
+    for region, metadata_df in metadata_dict.items():
+        header_df = pd.DataFrame([headers[path] for path in metadata_df["path"]], columns=HEADER_COLUMNS)
+        metadata_df = metadata_df.drop(columns=HEADER_COLUMNS, errors="ignore").reset_index(drop=True)
+        header_dict[region] = pd.concat([metadata_df, header_df], axis=1)
+    return header_dict
@@ -1,10 +1,19 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
 import numpy as np
 import pandas as pd
 
-import skimage.measure
+import deepcell
 from deepcell.applications import Mesmer
 from deepcell.utils.plot_utils import create_rgb_image, make_outline_overlay
 
+from pycodex import crop, markerstats
+
 
 ########################################################################################################################
 # subset
@@ -21,6 +30,8 @@ def subset_subregion(
     """
     Crop a specified subregion from each image in the marker dictionary.
 
+    For a lazy `MarkerDict`, markers that are not in memory are read window-only instead of being decoded in full.
+
     Args:
         marker_dict (dict[str, np.ndarray]):
             Dictionary containing marker names as keys and corresponding images as values.
@@ -32,6 +43,10 @@ def subset_subregion(
     Returns:
         dict[str, np.ndarray]: A new dictionary with cropped images.
     """
+    if hasattr(marker_dict, "read_window"):
+        # lazy marker dictionary: decode only the overlapping part of each file
+        return {marker: marker_dict.read_window(marker, x_min, x_max, y_min, y_max) for marker in marker_dict}
+
     cropped_marker_dict = {}
     for marker, im in marker_dict.items():
         cropped_im = im[y_min:y_max, x_min:x_max]
@@ -44,34 +59,423 @@ def subset_subregion(
 ########################################################################################################################
 
 
-def scale_marker_sum(marker_list: list[str], marker_dict: dict[str : np.ndarray], scale: bool = True) -> np.ndarray:
+def _row_chunks(shape: tuple[int, ...], itemsize: int, chunk_bytes: int = 4 * 1024**2) -> list[slice]:
+    """
+    Split the rows of an image into chunks of about `chunk_bytes`.
+
+    Args:
+        shape (tuple): Shape of the image.
+        itemsize (int): Bytes per element.
+        chunk_bytes (int, optional): Target bytes per chunk. Defaults to 4 MB.
+
+    Returns:
+        list: Row slices covering the image.
+    """
+    row_bytes = max(int(np.prod(shape[1:])) * itemsize, 1)
+    chunk_rows = max(1, chunk_bytes // row_bytes)
+    return [slice(row, min(row + chunk_rows, shape[0])) for row in range(0, shape[0], chunk_rows)]
+
+
+def _min_max(im: np.ndarray) -> tuple[float, float]:
+    """
+    Minimum and maximum of an image, computed chunk by chunk so that the image is read from memory once.
+
+    Args:
+        im (np.ndarray): Input image.
+
+    Returns:
+        Tuple: Minimum and maximum value.
+    """
+    im_min, im_max = np.inf, -np.inf
+    for rows in _row_chunks(im.shape, im.dtype.itemsize):
+        chunk = im[rows]
+        im_min = min(im_min, chunk.min())
+        im_max = max(im_max, chunk.max())
+    return float(im_min), float(im_max)
+
+
+def _marker_range(
+    marker_dict: dict[str, np.ndarray], marker: str, clip_percentiles: Optional[tuple[float, float]] = None
+) -> tuple[float, float]:
+    """
+    Value range used to scale a marker: its minimum and maximum, or the given pair of percentiles.
+
+    Statistics are taken from `marker_dict.stats` when the dictionary provides them (e.g. `metadata.MarkerDict`),
+    which avoids touching the pixels again; percentiles not stored yet are computed once and stored. Otherwise they
+    are computed from the image.
+
+    Args:
+        marker_dict (dict): Dictionary containing marker names as keys and corresponding images as values.
+        marker (str): Marker name.
+        clip_percentiles (tuple, optional): Lower and upper percentiles. Defaults to None for minimum and maximum.
+
+    Returns:
+        Tuple: Lower and upper bound of the value range.
+    """
+    if hasattr(marker_dict, "stats"):
+        stats = marker_dict.stats(marker, percentiles=clip_percentiles)
+        if clip_percentiles is None:
+            return stats["min"], stats["max"]
+        return tuple(markerstats.get_percentile(stats, q) for q in clip_percentiles)
+
+    im = marker_dict[marker]
+    if clip_percentiles is None:
+        return _min_max(im)
+    return tuple(float(value) for value in np.percentile(im, clip_percentiles))
+
+
+def scale_marker_sum(
+    marker_list: list[str],
+    marker_dict: dict[str : np.ndarray],
+    scale: bool = True,
+    dtype: np.dtype = np.float32,
+    clip_percentiles: Optional[tuple[float, float]] = None,
+) -> np.ndarray:
     """
     Sum scaled images of specified markers.
 
+    Each marker is read once: its minimum and maximum are computed in one chunked pass, and the scaled values are
+    accumulated chunk by chunk into a single preallocated output, so no full-size temporaries are created.
+    Markers (and sums) with a constant value contribute zeros instead of NaNs. The value range of each marker comes
+    from `marker_dict.stats` when available (see `_marker_range`), so a `metadata.MarkerDict` rescans pixels for it
+    only to add percentiles it has not stored yet.
+
     Args:
         marker_list (list): List of marker name to be scaled.
         marker_dict (dict): Dictionary containing marker names as keys and corresponding images as values.
         scale (bool, optional): Whether to scale the images or not. Defaults to True.
+        dtype (np.dtype, optional): Floating-point dtype of the output and the accumulation. Defaults to np.float32.
+        clip_percentiles (tuple, optional): Lower and upper percentiles (e.g. (1, 99)) used instead of the minimum and
+            maximum to scale each marker, clipping values outside them. Requires `scale`. Defaults to None.
 
     Returns:
         np.ndarray: Summed and scaled image of the specified markers.
+
+    Raises:
+        ValueError: If `clip_percentiles` is given with `scale=False`.
     """
-    scaled_marker_list = [
-        (marker_dict[marker] - marker_dict[marker].min()) / (marker_dict[marker].max() - marker_dict[marker].min())
-        if scale
-        else marker_dict[marker]
-        for marker in marker_list
-    ]
-    scaled_marker_sum = np.sum(scaled_marker_list, axis=0)
-    # scaled_marker_sum = (
-    #     255 * (scaled_marker_sum - scaled_marker_sum.min()) / (scaled_marker_sum.max() - scaled_marker_sum.min())
-    # ).astype("uint8")
-    scaled_marker_sum = (scaled_marker_sum - scaled_marker_sum.min()) / (
-        scaled_marker_sum.max() - scaled_marker_sum.min()
-    )
+    if clip_percentiles is not None and not scale:
+        raise ValueError("clip_percentiles requires scale=True")
+    shape = marker_dict[marker_list[0]].shape
+    scaled_marker_sum = np.zeros(shape, dtype=dtype)
+    chunks = _row_chunks(shape, np.dtype(dtype).itemsize)
+    buffer = np.empty((chunks[0].stop - chunks[0].start,) + shape[1:], dtype=dtype)
+
+    for marker in marker_list:
+        im = marker_dict[marker]
+        if scale:
+            im_min, im_max = _marker_range(marker_dict, marker, clip_percentiles)
+            factor = 1 / (im_max - im_min) if im_max > im_min else 0.0
+        else:
+            im_min, factor = 0.0, 1.0
+        for rows in chunks:
+            chunk_buffer = buffer[: rows.stop - rows.start]
+            np.subtract(im[rows], im_min, out=chunk_buffer, dtype=dtype, casting="unsafe")
+            np.multiply(chunk_buffer, factor, out=chunk_buffer, casting="unsafe")
+            if scale and clip_percentiles is not None:
+                np.clip(chunk_buffer, 0, 1, out=chunk_buffer)
+            np.add(scaled_marker_sum[rows], chunk_buffer, out=scaled_marker_sum[rows])
+
+    sum_min, sum_max = _min_max(scaled_marker_sum)
+    factor = 1 / (sum_max - sum_min) if sum_max > sum_min else 0.0
+    for rows in chunks:
+        np.subtract(scaled_marker_sum[rows], sum_min, out=scaled_marker_sum[rows], casting="unsafe")
+        np.multiply(scaled_marker_sum[rows], factor, out=scaled_marker_sum[rows], casting="unsafe")
     return scaled_marker_sum
 
 
+class MesmerSession:
+    """
+    Mesmer model handle that builds the model once and keeps track of setup and inference wall time.
+
+    Reusing one session across regions and parameter sets avoids rebuilding the TensorFlow model and reloading its
+    weights for every call of `segmentation_mesmer`. `get_mesmer_session` returns a process-wide default session.
+
+    Args:
+        raw_cache_size (int, optional): Number of raw network outputs kept by `predict_raw`. Defaults to 1.
+        **model_kwargs: Keyword arguments passed to `Mesmer` when the model is built.
+    """
+
+    def __init__(self, raw_cache_size: int = 1, **model_kwargs):
+        self._model_kwargs = model_kwargs
+        self._model = None
+        self._lock = threading.Lock()
+        self._raw_cache = OrderedDict()
+        self.raw_cache_size = raw_cache_size
+        self.setup_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.n_predictions = 0
+
+    @property
+    def model(self) -> Mesmer:
+        """Mesmer: The Mesmer application, built on first access."""
+        with self._lock:
+            if self._model is None:
+                start = time.perf_counter()
+                self._model = Mesmer(**self._model_kwargs)
+                self.setup_seconds += time.perf_counter() - start
+                logging.info(f"Mesmer model built in {self.setup_seconds:.1f} s")
+        return self._model
+
+    def predict(self, seg_stack: np.ndarray, **predict_kwargs) -> np.ndarray:
+        """
+        Run `Mesmer.predict` and record its wall time.
+
+        Args:
+            seg_stack (np.ndarray): Input of shape (batch, height, width, 2).
+            **predict_kwargs: Keyword arguments passed to `Mesmer.predict`.
+
+        Returns:
+            np.ndarray: Predicted labels of shape (batch, height, width, 1).
+        """
+        model = self.model
+        start = time.perf_counter()
+        segmentation_mask = model.predict(seg_stack, **predict_kwargs)
+        self.inference_seconds += time.perf_counter() - start
+        self.n_predictions += 1
+        return segmentation_mask
+
+    def _private_model(self) -> Mesmer:
+        """
+        Get the model after checking that it exposes the private deepcell methods used by `predict_raw` and
+        `postprocess`, which are not part of the public deepcell API (tested with deepcell 0.12).
+
+        Returns:
+            Mesmer: The Mesmer application.
+
+        Raises:
+            RuntimeError: If the installed deepcell lacks one of the methods.
+        """
+        model = self.model
+        missing = [name for name in _MESMER_PRIVATE_METHODS if not callable(getattr(model, name, None))]
+        if missing:
+            version = getattr(deepcell, "__version__", "unknown")
+            raise RuntimeError(
+                f"deepcell {version} does not provide Mesmer.{', Mesmer.'.join(missing)}, needed to split inference "
+                "from post-processing; use segmentation_mesmer or install deepcell 0.12"
+            )
+        return model
+
+    def predict_raw(self, seg_stack: np.ndarray, image_mpp: float, batch_size: int = 4) -> dict:
+        """
+        Run the Mesmer network without post-processing, caching the output for the given input and pixel size.
+
+        Args:
+            seg_stack (np.ndarray): Input of shape (batch, height, width, 2).
+            image_mpp (float): Pixel size in micrometers.
+            batch_size (int, optional): Number of images predicted at once. Defaults to 4, as in `Mesmer.predict`.
+
+        Returns:
+            dict: Raw network output, to be passed to `postprocess`.
+        """
+        seg_stack = np.ascontiguousarray(seg_stack)
+        key = (hashlib.sha1(seg_stack).hexdigest(), seg_stack.shape, seg_stack.dtype.str, image_mpp)
+        with self._lock:
+            if key in self._raw_cache:
+                self._raw_cache.move_to_end(key)
+                return self._raw_cache[key]
+
+        # mirrors the network part of `Mesmer.predict` (`Application._predict_segmentation`)
+        model = self._private_model()
+        start = time.perf_counter()
+        resized_stack = model._resize_input(seg_stack, image_mpp)
+        raw_output = model._run_model(
+            image=resized_stack, batch_size=batch_size, pad_mode="constant", preprocess_kwargs={}
+        )
+        self.inference_seconds += time.perf_counter() - start
+        self.n_predictions += 1
+
+        with self._lock:
+            self._raw_cache[key] = raw_output
+            while len(self._raw_cache) > self.raw_cache_size:
+                self._raw_cache.popitem(last=False)
+        return raw_output
+
+    def postprocess(
+        self,
+        raw_output: dict,
+        image_shape: tuple[int, ...],
+        maxima_threshold: float = 0.075,
+        interior_threshold: float = 0.20,
+        compartment: str = "nuclear",
+        nuclear_thresholds: bool = False,
+    ) -> np.ndarray:
+        """
+        Run only the watershed post-processing of Mesmer on a raw network output.
+
+        Args:
+            raw_output (dict): Raw network output from `predict_raw`.
+            image_shape (tuple): Shape of the input passed to `predict_raw`.
+            maxima_threshold (float, optional): Maxima threshold, larger for fewer cells. Defaults to 0.075.
+            interior_threshold (float, optional): Interior threshold, larger for larger cells. Defaults to 0.20.
+            compartment (str, optional): Compartment to segment. Defaults to "nuclear".
+            nuclear_thresholds (bool, optional): Whether to apply the thresholds to the nuclear compartment too.
+                Defaults to False, which keeps the nuclear defaults of Mesmer (see `_mesmer_postprocess_kwargs`).
+
+        Returns:
+            np.ndarray: Predicted labels of shape (batch, height, width, 1), as returned by `predict`.
+        """
+        model = self._private_model()
+        whole_cell_kwargs, nuclear_kwargs = _mesmer_postprocess_kwargs(
+            maxima_threshold, interior_threshold, nuclear_thresholds=nuclear_thresholds
+        )
+        segmentation_mask = model._postprocess(
+            raw_output,
+            whole_cell_kwargs={**_MESMER_WHOLE_CELL_DEFAULTS, **whole_cell_kwargs},
+            nuclear_kwargs={**_MESMER_NUCLEAR_DEFAULTS, **(nuclear_kwargs or {})},
+            compartment=compartment,
+        )
+        return model._resize_output(segmentation_mask, image_shape)
+
+    def timing_summary(self) -> dict[str, float]:
+        """
+        Summarize wall time spent on model setup versus inference.
+
+        Returns:
+            dict: Setup seconds, inference seconds, number of predictions and fraction of time spent on setup.
+        """
+        total_seconds = self.setup_seconds + self.inference_seconds
+        return {
+            "setup_seconds": self.setup_seconds,
+            "inference_seconds": self.inference_seconds,
+            "n_predictions": self.n_predictions,
+            "setup_fraction": self.setup_seconds / total_seconds if total_seconds > 0 else 0.0,
+        }
+
+
+_DEFAULT_MESMER_SESSION = None
+
+
+def get_mesmer_session() -> MesmerSession:
+    """
+    Get the process-wide default Mesmer session, creating it on first use.
+
+    Returns:
+        MesmerSession: The default session shared by all calls in this process.
+    """
+    global _DEFAULT_MESMER_SESSION
+    if _DEFAULT_MESMER_SESSION is None:
+        _DEFAULT_MESMER_SESSION = MesmerSession()
+    return _DEFAULT_MESMER_SESSION
+
+
+# post-processing defaults of `Mesmer.predict`, needed when post-processing raw outputs directly
+_MESMER_WHOLE_CELL_DEFAULTS = {
+    "maxima_threshold": 0.075,
+    "maxima_smooth": 0,
+    "interior_threshold": 0.2,
+    "interior_smooth": 2,
+    "small_objects_threshold": 15,
+    "fill_holes_threshold": 15,
+    "radius": 2,
+}
+_MESMER_NUCLEAR_DEFAULTS = {**_MESMER_WHOLE_CELL_DEFAULTS, "maxima_threshold": 0.1}
+
+# private `Mesmer` methods used to run the network and the post-processing separately
+_MESMER_PRIVATE_METHODS = ("_resize_input", "_run_model", "_postprocess", "_resize_output")
+
+
+def _mesmer_postprocess_kwargs(
+    maxima_threshold: float, interior_threshold: float, nuclear_thresholds: bool = False
+) -> tuple[dict, Optional[dict]]:
+    """
+    Post-processing keyword arguments for the whole-cell and nuclear compartments of Mesmer.
+
+    The thresholds are applied to the whole-cell compartment. The nuclear compartment keeps the defaults of Mesmer
+    unless `nuclear_thresholds` is set; since segmentation uses the nuclear compartment, the thresholds only change
+    the masks in that case.
+
+    Args:
+        maxima_threshold (float): Maxima threshold, larger for fewer cells.
+        interior_threshold (float): Interior threshold, larger for larger cells.
+        nuclear_thresholds (bool, optional): Whether to apply the thresholds to the nuclear compartment too.
+            Defaults to False.
+
+    Returns:
+        Tuple: Whole-cell post-processing keyword arguments, and nuclear ones or None for the defaults.
+    """
+    kwargs = {"maxima_threshold": maxima_threshold, "interior_threshold": interior_threshold}
+    return kwargs.copy(), kwargs.copy() if nuclear_thresholds else None
+
+
+def _mesmer_input(
+    marker_dict: dict[str, np.ndarray], boundary_markers: list[str], internal_markers: list[str], scale: bool = True
+) -> np.ndarray:
+    """
+    Build the two-channel Mesmer input from the summed internal and boundary markers.
+
+    Args:
+        marker_dict (dict): Dictionary containing marker names as keys and corresponding images as values.
+        boundary_markers (list): List of boundary marker names.
+        internal_markers (list): List of internal marker names.
+        scale (bool, optional): Whether to scale the images or not. Defaults to True.
+
+    Returns:
+        np.ndarray: Input of shape (1, height, width, 2).
+    """
+    boundary_sum = scale_marker_sum(boundary_markers, marker_dict, scale=scale)
+    internal_sum = scale_marker_sum(internal_markers, marker_dict, scale=scale)
+    seg_stack = np.stack((internal_sum, boundary_sum), axis=-1)
+    return np.expand_dims(seg_stack, 0)
+
+
+def _predict_mesmer_tiled(
+    session: MesmerSession,
+    seg_stack: np.ndarray,
+    tile_size: int,
+    tile_overlap: int,
+    **predict_kwargs,
+) -> np.ndarray:
+    """
+    Run Mesmer on overlapping tiles and stitch the labels into one globally consistent mask.
+
+    The image is divided into blocks with `crop.crop_image_into_blocks`, and each block is predicted together with
+    `tile_overlap` pixels of context on every side. A tile keeps only the cells whose centroid lies inside its block,
+    so a cell cut by a tile border is taken whole from the neighbouring tile that owns it. Kept cells are relabeled
+    with a running offset and only fill pixels that no earlier cell has claimed.
+
+    Args:
+        session (MesmerSession): Mesmer session to run the model with.
+        seg_stack (np.ndarray): Input of shape (1, height, width, 2).
+        tile_size (int): Maximum size of a block along both dimensions, before adding the overlap.
+        tile_overlap (int): Context in pixels added on every side of a block.
+        **predict_kwargs: Keyword arguments passed to `Mesmer.predict`.
+
+    Returns:
+        np.ndarray: Stitched segmentation mask of shape (1, height, width, 1).
+    """
+    height, width = seg_stack.shape[1:3]
+    xy_limits = crop.crop_image_into_blocks((height, width), max_block_size=tile_size)
+
+    segmentation_mask = np.zeros((height, width), dtype=np.int32)
+    n_label = 0
+    for x_beg, x_end, y_beg, y_end in xy_limits.values():
+        tile_x_beg, tile_x_end = max(x_beg - tile_overlap, 0), min(x_end + tile_overlap, width)
+        tile_y_beg, tile_y_end = max(y_beg - tile_overlap, 0), min(y_end + tile_overlap, height)
+        tile_mask = session.predict(seg_stack[:, tile_y_beg:tile_y_end, tile_x_beg:tile_x_end, :], **predict_kwargs)
+        tile_mask = tile_mask[0, ..., 0]
+
+        # keep the cells whose centroid lies inside the block
+        n_bins = int(tile_mask.max()) + 1
+        tiles = [(0, tile_mask.shape[1], 0, tile_mask.shape[0])]
+        counts, sum_y, sum_x, _ = _aggregate_by_label(tile_mask, {}, [], n_bins, tiles)
+        label = np.flatnonzero(counts)
+        label = label[label != 0]
+        y_cent = sum_y[label] / counts[label] + tile_y_beg
+        x_cent = sum_x[label] / counts[label] + tile_x_beg
+        owned = label[(y_cent >= y_beg) & (y_cent < y_end) & (x_cent >= x_beg) & (x_cent < x_end)]
+
+        # relabel with a global offset and fill only unclaimed pixels
+        lut = np.zeros(n_bins, dtype=np.int32)
+        lut[owned] = np.arange(n_label + 1, n_label + len(owned) + 1)
+        n_label += len(owned)
+        tile_global = lut[tile_mask]
+        target = segmentation_mask[tile_y_beg:tile_y_end, tile_x_beg:tile_x_end]
+        unclaimed = (tile_global != 0) & (target == 0)
+        target[unclaimed] = tile_global[unclaimed]
+    return segmentation_mask[np.newaxis, ..., np.newaxis]
+
+
 def segmentation_mesmer(
     marker_dict: dict[str : np.ndarray],
     boundary_markers: list[str],
@@ -80,7 +484,14 @@ def segmentation_mesmer(
     scale: bool = True,
     maxima_threshold: float = 0.075,
     interior_threshold: float = 0.20,
-) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    session: Optional[MesmerSession] = None,
+    tile_size: Optional[int] = None,
+    tile_overlap: int = 128,
+    outputs: str = "all",
+    overlay_downsample: int = 1,
+    nuclear_thresholds: bool = False,
+    batch_size: int = 4,
+) -> tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
     """
     Perform segmentation (Mesmer) on a given image.
 
@@ -92,72 +503,316 @@ def segmentation_mesmer(
         scale (bool, optional): Whether to scale the images or not. Defaults to True.
         maxima_threshold (float, optional): Maxima threshold, larger for fewer cells. Defaults to 0.075.
         interior_threshold (float, optional): Interior threshold, larger for larger cells. Defaults to 0.20.
+        session (MesmerSession, optional): Mesmer session to run the model with. Defaults to None, which uses the
+            process-wide default session from `get_mesmer_session`.
+        tile_size (int, optional): If the image is larger than `tile_size` along either dimension, run Mesmer on
+            overlapping tiles of about this size and stitch the labels (see `_predict_mesmer_tiled`), so that peak
+            memory of inference is set by the tile size. Defaults to None, which predicts the whole image at once.
+        tile_overlap (int, optional): Context in pixels added on every side of a tile; should exceed the diameter of
+            the largest cells. Defaults to 128.
+        outputs (str, optional): Outputs to render besides the mask: "mask" for the mask only, "overlay" for the mask
+            and overlay, or "all" for the mask, RGB image and overlay. Outputs that are not requested are returned as
+            None and can be rendered later with `render_overlay`. Defaults to "all".
+        overlay_downsample (int, optional): Downsampling factor of the RGB image and overlay. Defaults to 1.
+        nuclear_thresholds (bool, optional): Whether to apply the maxima and interior thresholds to the nuclear
+            compartment, which is the one segmented. Defaults to False, which passes them to the whole-cell
+            compartment only and keeps the nuclear defaults of Mesmer.
+        batch_size (int, optional): Number of images predicted at once. Defaults to 4.
 
     Returns:
         Tuple: Segmentation mask, RGB image, and overlay.
     """
-    # Data for markers
-    boundary_sum = scale_marker_sum(boundary_markers, marker_dict, scale=scale)
-    internal_sum = scale_marker_sum(internal_markers, marker_dict, scale=scale)
+    if outputs not in ["mask", "overlay", "all"]:
+        raise ValueError(f"outputs must be 'mask', 'overlay' or 'all', got '{outputs}'")
 
     # Data for Mesmer
-    seg_stack = np.stack((internal_sum, boundary_sum), axis=-1)
-    seg_stack = np.expand_dims(seg_stack, 0)
+    seg_stack = _mesmer_input(marker_dict, boundary_markers, internal_markers, scale=scale)
 
     # Do segmentation
-    mesmer = Mesmer()
-    segmentation_mask = mesmer.predict(
-        seg_stack,
-        image_mpp=pixel_size_um,
-        postprocess_kwargs_whole_cell={
-            "maxima_threshold": maxima_threshold,
-            "interior_threshold": interior_threshold,
-        },
-        compartment="nuclear",
+    if session is None:
+        session = get_mesmer_session()
+    whole_cell_kwargs, nuclear_kwargs = _mesmer_postprocess_kwargs(
+        maxima_threshold, interior_threshold, nuclear_thresholds=nuclear_thresholds
     )
-    rgb_image = create_rgb_image(seg_stack, channel_colors=["blue", "green"])
-    overlay = make_outline_overlay(rgb_data=rgb_image, predictions=segmentation_mask)
+    predict_kwargs = {
+        "image_mpp": pixel_size_um,
+        "batch_size": batch_size,
+        "postprocess_kwargs_whole_cell": whole_cell_kwargs,
+        "compartment": "nuclear",
+    }
+    if nuclear_kwargs is not None:
+        predict_kwargs["postprocess_kwargs_nuclear"] = nuclear_kwargs
+    height, width = seg_stack.shape[1:3]
+    if tile_size is not None and max(height, width) > tile_size:
+        segmentation_mask = _predict_mesmer_tiled(session, seg_stack, tile_size, tile_overlap, **predict_kwargs)
+    else:
+        segmentation_mask = session.predict(seg_stack, **predict_kwargs)
     segmentation_mask = segmentation_mask[0, ..., 0]
-    rgb_image = rgb_image[0, ...]
-    overlay = overlay[0, ...]
+
+    # Render QC images only when requested
+    rgb_image, overlay = None, None
+    if outputs != "mask":
+        rgb_image, overlay = _render_overlay(seg_stack, segmentation_mask, downsample=overlay_downsample)
+        if outputs == "overlay":
+            rgb_image = None
     return segmentation_mask, rgb_image, overlay
 
 
+def _render_overlay(
+    seg_stack: np.ndarray, segmentation_mask: np.ndarray, downsample: int = 1
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Render the RGB image of a Mesmer input and the segmentation outlines on top of it.
+
+    Args:
+        seg_stack (np.ndarray): Mesmer input of shape (1, height, width, 2).
+        segmentation_mask (np.ndarray): Segmentation mask of shape (height, width).
+        downsample (int, optional): Downsampling factor; the input is area-averaged and the mask subsampled.
+            Defaults to 1.
+
+    Returns:
+        Tuple: RGB image and overlay.
+    """
+    if downsample > 1:
+        height, width = seg_stack.shape[1] // downsample, seg_stack.shape[2] // downsample
+        seg_stack = seg_stack[:, : height * downsample, : width * downsample, :]
+        seg_stack = seg_stack.reshape(1, height, downsample, width, downsample, -1).mean(axis=(2, 4))
+        segmentation_mask = segmentation_mask[::downsample, ::downsample][:height, :width]
+    rgb_image = create_rgb_image(seg_stack, channel_colors=["blue", "green"])
+    overlay = make_outline_overlay(rgb_data=rgb_image, predictions=segmentation_mask[np.newaxis, ..., np.newaxis])
+    return rgb_image[0, ...], overlay[0, ...]
+
+
+def render_overlay(
+    marker_dict: dict[str, np.ndarray],
+    boundary_markers: list[str],
+    internal_markers: list[str],
+    segmentation_mask: np.ndarray,
+    scale: bool = True,
+    downsample: int = 1,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Render the RGB image and segmentation overlay of an existing mask, e.g. one saved without QC images.
+
+    Args:
+        marker_dict (dict): Dictionary containing marker names as keys and corresponding images as values.
+        boundary_markers (list): List of boundary marker names.
+        internal_markers (list): List of internal marker names.
+        segmentation_mask (np.ndarray): Segmentation mask to outline.
+        scale (bool, optional): Whether to scale the images or not. Defaults to True.
+        downsample (int, optional): Downsampling factor of the rendered images. Defaults to 1.
+
+    Returns:
+        Tuple: RGB image and overlay.
+    """
+    seg_stack = _mesmer_input(marker_dict, boundary_markers, internal_markers, scale=scale)
+    return _render_overlay(seg_stack, segmentation_mask, downsample=downsample)
+
+
+def sweep_mesmer_thresholds(
+    marker_dict: dict[str, np.ndarray],
+    boundary_markers: list[str],
+    internal_markers: list[str],
+    pixel_size_um: float,
+    maxima_thresholds: list[float],
+    interior_thresholds: list[float],
+    scale: bool = True,
+    session: Optional[MesmerSession] = None,
+    nuclear_thresholds: bool = True,
+    batch_size: int = 4,
+) -> tuple[pd.DataFrame, dict[tuple[float, float], np.ndarray]]:
+    """
+    Segment (Mesmer) with every pair of maxima and interior thresholds, running the network only once.
+
+    The raw network output is cached by the session for the given input and pixel size, and only the watershed
+    post-processing is repeated for each pair, so a 5 x 5 sweep costs one inference plus 25 post-processing passes.
+    Each mask equals the one `segmentation_mesmer` returns for the same thresholds and `nuclear_thresholds`. With the
+    default `nuclear_thresholds=True`, reproduce a chosen pair in batch with
+    `utils.segmentation_mesmer(..., maxima_threshold, interior_threshold, nuclear_thresholds=True)`; with its default
+    of False, the batch masks ignore the thresholds.
+
+    Args:
+        marker_dict (dict): Dictionary containing marker names as keys and corresponding images as values.
+        boundary_markers (list): List of boundary marker names.
+        internal_markers (list): List of internal marker names.
+        pixel_size_um (float): Pixel size in micrometers.
+        maxima_thresholds (list): Maxima thresholds to try, larger for fewer cells.
+        interior_thresholds (list): Interior thresholds to try, larger for larger cells.
+        scale (bool, optional): Whether to scale the images or not. Defaults to True.
+        session (MesmerSession, optional): Mesmer session to run the model with. Defaults to None, which uses the
+            process-wide default session from `get_mesmer_session`.
+        nuclear_thresholds (bool, optional): Whether to apply the thresholds to the nuclear compartment, which is the
+            one segmented. Defaults to True, since otherwise the thresholds do not change the masks.
+        batch_size (int, optional): Number of images predicted at once. Defaults to 4.
+
+    Returns:
+        Tuple: DataFrame with the cell count and median and mean cell size of each threshold pair, and dictionary
+        containing (maxima_threshold, interior_threshold) as keys and segmentation masks as values.
+    """
+    if session is None:
+        session = get_mesmer_session()
+    seg_stack = _mesmer_input(marker_dict, boundary_markers, internal_markers, scale=scale)
+    raw_output = session.predict_raw(seg_stack, image_mpp=pixel_size_um, batch_size=batch_size)
+
+    summary = []
+    mask_dict = {}
+    for maxima_threshold in maxima_thresholds:
+        for interior_threshold in interior_thresholds:
+            segmentation_mask = session.postprocess(
+                raw_output,
+                seg_stack.shape,
+                maxima_threshold=maxima_threshold,
+                interior_threshold=interior_threshold,
+                nuclear_thresholds=nuclear_thresholds,
+            )[0, ..., 0]
+            cell_size = np.bincount(segmentation_mask.ravel().astype(np.intp))[1:]
+            cell_size = cell_size[cell_size > 0]
+            summary.append(
+                {
+                    "maxima_threshold": maxima_threshold,
+                    "interior_threshold": interior_threshold,
+                    "n_cells": len(cell_size),
+                    "median_cell_size": np.median(cell_size) if len(cell_size) else np.nan,
+                    "mean_cell_size": np.mean(cell_size) if len(cell_size) else np.nan,
+                }
+            )
+            mask_dict[(maxima_threshold, interior_threshold)] = segmentation_mask
+    return pd.DataFrame(summary), mask_dict
+
+
+def _plan_feature_tiles(
+    shape: tuple[int, int], bytes_per_pixel: int, memory_budget_mb: Optional[float] = None
+) -> list[tuple[int, int, int, int]]:
+    """
+    Plan row strips (split into columns if a single row does not fit) that keep per-tile temporaries in budget.
+
+    Args:
+        shape (tuple[int, int]): Height and width of the segmentation mask.
+        bytes_per_pixel (int): Bytes of temporaries needed per pixel of a tile.
+        memory_budget_mb (float, optional): Memory budget for one tile in MB. None for a single tile.
+
+    Returns:
+        list: Tiles as (x_beg, x_end, y_beg, y_end).
+    """
+    height, width = shape
+    if memory_budget_mb is None:
+        return [(0, width, 0, height)]
+
+    tile_pixels = max(1, int(memory_budget_mb * 1024**2) // bytes_per_pixel)
+    tile_height = max(1, min(height, tile_pixels // max(width, 1)))
+    tile_width = width if tile_pixels >= width else tile_pixels
+    return [
+        (x_beg, min(x_beg + tile_width, width), y_beg, min(y_beg + tile_height, height))
+        for y_beg in range(0, height, tile_height)
+        for x_beg in range(0, width, tile_width)
+    ]
+
+
+def _aggregate_by_label(
+    segmentation_mask: np.ndarray,
+    marker_dict: dict[str, np.ndarray],
+    marker_name: list[str],
+    n_bins: int,
+    tiles: list[tuple[int, int, int, int]],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Aggregate pixel counts, coordinate sums and marker intensity sums per label with `np.bincount`.
+
+    Each tile is reduced independently and accumulated into global per-label arrays, so cells crossing tile borders
+    are aggregated exactly. Markers are visited one at a time and only one tile of a marker is read at once.
+
+    Args:
+        segmentation_mask (np.ndarray): Segmentation mask with non-negative integer labels.
+        marker_dict (dict): Dictionary containing marker names as keys and corresponding images as values.
+        marker_name (list): Marker names, in the column order of the returned intensity sums.
+        n_bins (int): Number of label bins, i.e. the maximum label + 1.
+        tiles (list): Tiles as (x_beg, x_end, y_beg, y_end) covering the mask.
+
+    Returns:
+        Tuple: Per-label pixel counts, sums of row coordinates, sums of column coordinates, and marker intensity
+        sums of shape (n_bins, n_marker).
+    """
+
+    def _tile_labels(tile: tuple[int, int, int, int]) -> np.ndarray:
+        x_beg, x_end, y_beg, y_end = tile
+        return segmentation_mask[y_beg:y_end, x_beg:x_end].ravel().astype(np.intp, copy=False)
+
+    # keep the flattened labels around when the whole mask is a single tile
+    single_labels = _tile_labels(tiles[0]) if len(tiles) == 1 else None
+
+    counts = np.zeros(n_bins, dtype=np.int64)
+    sum_y = np.zeros(n_bins)
+    sum_x = np.zeros(n_bins)
+    for tile in tiles:
+        x_beg, x_end, y_beg, y_end = tile
+        labels = single_labels if single_labels is not None else _tile_labels(tile)
+        rows = np.repeat(np.arange(y_beg, y_end, dtype=np.float64), x_end - x_beg)
+        cols = np.tile(np.arange(x_beg, x_end, dtype=np.float64), y_end - y_beg)
+        counts += np.bincount(labels, minlength=n_bins)
+        sum_y += np.bincount(labels, weights=rows, minlength=n_bins)
+        sum_x += np.bincount(labels, weights=cols, minlength=n_bins)
+
+    # one bincount pass per marker and tile, without stacking the markers into one array
+    sums = np.zeros((n_bins, len(marker_name)))
+    for j, marker in enumerate(marker_name):
+        im = marker_dict[marker]
+        for tile in tiles:
+            x_beg, x_end, y_beg, y_end = tile
+            labels = single_labels if single_labels is not None else _tile_labels(tile)
+            weights = np.ravel(im[y_beg:y_end, x_beg:x_end])
+            sums[:, j] += np.bincount(labels, weights=weights, minlength=n_bins)
+    return counts, sum_y, sum_x, sums
+
+
 def extract_cell_features(
-    marker_dict: dict[str, np.ndarray], segmentation_mask: np.ndarray
+    marker_dict: dict[str, np.ndarray],
+    segmentation_mask: np.ndarray,
+    memory_budget_mb: Optional[float] = None,
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
     """
     Extract single cell features from segmeantaion mask.
 
+    Cell size, centroids and marker intensity sums are aggregated per label with `np.bincount` over the flattened
+    mask, which gives the same tables as `skimage.measure.regionprops` (identical for integer images, equal within
+    float tolerance for float images) without looping over cells in Python.
+
+    With `memory_budget_mb`, the mask is walked in row strips (or tiles, if one row exceeds the budget) and per-label
+    sums, sizes and centroid moments are accumulated across strips, so only one strip of one marker is held in memory
+    at a time. The per-label accumulators (about 8 bytes x (n_marker + 3) per label) are not part of the budget.
+
     Args:
         marker_dict (dict): Dictionary containing marker names as keys and corresponding images as values.
         segmentation_mask (np.ndarray): Segmentation mask to extract single cell information.
+        memory_budget_mb (float, optional): Memory budget for the temporaries of one strip in MB. Defaults to None,
+            which processes the whole mask at once.
 
     Returns:
         Tuple: DataFrames containing single cell data and size-scaled data.
     """
     marker_name = [marker for marker in marker_dict.keys()]
-    marker_array = np.stack([marker_dict[marker] for marker in marker_name], axis=2)
+    n_bins = int(segmentation_mask.max()) + 1 if segmentation_mask.size else 1
+
+    # aggregate pixels by label, tile by tile
+    # temporaries per pixel: flattened labels, float64 weights, and the marker strip itself (at most 8 bytes)
+    tiles = _plan_feature_tiles(segmentation_mask.shape, 8 + 8 + 8, memory_budget_mb)
+    counts, sum_y, sum_x, sums = _aggregate_by_label(segmentation_mask, marker_dict, marker_name, n_bins, tiles)
+    cell_label = np.flatnonzero(counts)
+    cell_label = cell_label[cell_label != 0]
+    cell_size = counts[cell_label].astype(np.float64)
 
     # extract properties
-    props = skimage.measure.regionprops_table(
-        segmentation_mask,
-        properties=["label", "area", "centroid"],
+    props_df = pd.DataFrame(
+        {
+            "cellLabel": cell_label,
+            "cellSize": cell_size,
+            "Y_cent": sum_y[cell_label] / cell_size,
+            "X_cent": sum_x[cell_label] / cell_size,
+        }
     )
-    props_df = pd.DataFrame(props)
-    props_df.columns = ["cellLabel", "cellSize", "Y_cent", "X_cent"]
 
     # exctract marker intensity
-    stats = skimage.measure.regionprops(segmentation_mask)
-    n_cell = len(stats)
-    n_marker = len(marker_name)
-    sums = np.zeros((n_cell, n_marker))
-    avgs = np.zeros((n_cell, n_marker))
-    for i, region in enumerate(stats):
-        # Extract the pixel values for the current region from the marker_array
-        label_counts = [marker_array[coord[0], coord[1], :] for coord in region.coords]
-        sums[i] = np.sum(label_counts, axis=0)  # Sum of marker intensities
-        avgs[i] = sums[i] / region.area  # Average intensity per unit area
+    sums = sums[cell_label]  # Sum of marker intensities
+    avgs = sums / cell_size[:, None]  # Average intensity per unit area
 
     sums_df = pd.DataFrame(sums, columns=marker_name)
     avgs_df = pd.DataFrame(avgs, columns=marker_name)
@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+import tifffile
+
+DEFAULT_PERCENTILES = [0.1, 0.5, 1, 2, 5, 25, 50, 75, 95, 98, 99, 99.5, 99.9]
+
+########################################################################################################################
+# compute statistics
+########################################################################################################################
+
+
+def _percentile_from_counts(values: np.ndarray, counts: np.ndarray, percentiles: list[float]) -> list[float]:
+    """
+    Percentiles of a sample given as distinct values and their counts, with the linear interpolation of `np.percentile`.
+
+    Args:
+        values (np.ndarray): Sorted distinct values.
+        counts (np.ndarray): Number of occurrences of each value.
+        percentiles (list): Percentiles to compute, between 0 and 100.
+
+    Returns:
+        list: Value of each percentile.
+    """
+    cumulative = np.cumsum(counts)
+    n = cumulative[-1]
+    result = []
+    for q in percentiles:
+        position = q / 100 * (n - 1)
+        lower, upper = int(np.floor(position)), int(np.ceil(position))
+        value_lower = values[np.searchsorted(cumulative, lower, side="right")]
+        value_upper = values[np.searchsorted(cumulative, upper, side="right")]
+        result.append(float(value_lower + (value_upper - value_lower) * (position - lower)))
+    return result
+
+
+def compute_marker_stats(
+    im: np.ndarray,
+    percentiles: list[float] = DEFAULT_PERCENTILES,
+    n_bins: int = 256,
+    chunk_bytes: int = 16 * 1024**2,
+) -> dict:
+    """
+    Compute minimum, maximum, mean, percentiles and a fixed-bin histogram of a marker image.
+
+    Images with 8- or 16-bit integer pixels are summarized in a single streaming pass that counts every pixel value, so
+    all statistics are exact. Other images take a pass for the value range and one for a 65536-bin histogram, from
+    which percentiles are interpolated (accurate to 1/65536 of the value range).
+
+    Args:
+        im (np.ndarray): Marker image.
+        percentiles (list, optional): Percentiles to compute, between 0 and 100. Defaults to DEFAULT_PERCENTILES.
+        n_bins (int, optional): Number of bins of the histogram over [min, max]. Defaults to 256.
+        chunk_bytes (int, optional): Bytes of pixels processed at once. Defaults to 16 MB.
+
+    Returns:
+        dict: Statistics with keys "shape", "dtype", "min", "max", "mean", "percentiles" (percentile -> value) and
+        "histogram" ("counts" and "edges").
+    """
+    row_bytes = max(int(np.prod(im.shape[1:])) * im.dtype.itemsize, 1)
+    chunk_rows = max(1, chunk_bytes // row_bytes)
+    chunks = [slice(row, row + chunk_rows) for row in range(0, im.shape[0], chunk_rows)]
+
+    if np.issubdtype(im.dtype, np.integer) and im.dtype.itemsize <= 2:
+        # exact: count every value in one pass
+        offset = int(np.iinfo(im.dtype).min)
+        value_counts = np.zeros(2 ** (8 * im.dtype.itemsize), dtype=np.int64)
+        for rows in chunks:
+            chunk = im[rows].ravel().astype(np.int64) - offset
+            value_counts += np.bincount(chunk, minlength=len(value_counts))
+        present = np.flatnonzero(value_counts)
+        values = present + offset
+        counts = value_counts[present]
+        im_min, im_max = float(values[0]), float(values[-1])
+        mean = float(np.dot(values.astype(np.float64), counts) / counts.sum())
+    else:
+        im_min, im_max, total = np.inf, -np.inf, 0.0
+        for rows in chunks:
+            chunk = im[rows]
+            im_min = min(im_min, float(chunk.min()))
+            im_max = max(im_max, float(chunk.max()))
+            total += float(chunk.sum(dtype=np.float64))
+        mean = total / im.size
+        fine_counts = np.zeros(2**16, dtype=np.int64)
+        for rows in chunks:
+            fine_counts += np.histogram(im[rows], bins=len(fine_counts), range=(im_min, im_max))[0]
+        fine_edges = np.linspace(im_min, im_max, len(fine_counts) + 1)
+        present = np.flatnonzero(fine_counts)
+        values = (fine_edges[present] + fine_edges[present + 1]) / 2
+        counts = fine_counts[present]
+
+    hist_counts, hist_edges = np.histogram(values, bins=n_bins, range=(im_min, im_max), weights=counts)
+    return {
+        "shape": list(im.shape),
+        "dtype": im.dtype.str,
+        "min": im_min,
+        "max": im_max,
+        "mean": mean,
+        "percentiles": dict(zip([f"{q:g}" for q in percentiles], _percentile_from_counts(values, counts, percentiles))),
+        "histogram": {"counts": hist_counts.astype(np.int64).tolist(), "edges": hist_edges.tolist()},
+    }
+
+
+def get_percentile(stats: dict, q: float) -> float:
+    """
+    Look up a percentile in marker statistics.
+
+    Args:
+        stats (dict): Marker statistics from `compute_marker_stats`.
+        q (float): Percentile, between 0 and 100.
+
+    Returns:
+        float: Value of the percentile.
+    """
+    key = f"{q:g}"
+    if key not in stats["percentiles"]:
+        raise ValueError(f"Percentile {q} not in marker statistics, available: {list(stats['percentiles'])}")
+    return stats["percentiles"][key]
+
+
+########################################################################################################################
+# persistent store
+########################################################################################################################
+
+
+class MarkerStatsStore:
+    """
+    Per-file marker statistics, keyed by absolute path, file size and modification time.
+
+    Statistics are computed once per file with `compute_marker_stats`. By default they are kept in memory for the
+    session only. With `path`, they are also persisted in that JSON file (for example inside an output directory) and
+    reused across sessions; the data directories are never written to. A changed file (different size or mtime) is
+    summarized again.
+
+    Args:
+        path (str, optional): Path to the JSON file persisting the statistics. Defaults to None, which keeps them in
+            memory only.
+        percentiles (list, optional): Percentiles to compute, between 0 and 100. Defaults to DEFAULT_PERCENTILES.
+        n_bins (int, optional): Number of histogram bins. Defaults to 256.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        percentiles: list[float] = DEFAULT_PERCENTILES,
+        n_bins: int = 256,
+    ):
+        self.path = path
+        self.percentiles = list(percentiles)
+        self.n_bins = n_bins
+        self._lock = threading.RLock()
+        self._entries = self._read() if path is not None else {}
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # merge entries written by other processes sharing the file, then replace it atomically
+        entries = {**self._read(), **self._entries}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(entries, file)
+        os.replace(tmp_path, self.path)
+        self._entries = entries
+
+    def get(
+        self,
+        path: str,
+        load: Optional[Callable[[], np.ndarray]] = None,
+        percentiles: Optional[list[float]] = None,
+    ) -> dict:
+        """
+        Get the statistics of a marker file, computing them if they are missing or stale.
+
+        Args:
+            path (str): Path to the marker image.
+            load (Callable, optional): Function returning the decoded image, used instead of reading `path` when the
+                statistics need to be computed. Defaults to None.
+            percentiles (list, optional): Percentiles needed besides the store's `percentiles`. If the entry lacks
+                any of them, the statistics are computed again with the union and saved. Defaults to None.
+
+        Returns:
+            dict: Marker statistics from `compute_marker_stats`.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        required = [*self.percentiles, *(percentiles or [])]
+        with self._lock:
+            entry = self._entries.get(path)
+        valid = (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime
+            and entry["n_bins"] == self.n_bins
+        )
+        if valid and all(f"{q:g}" in entry["stats"]["percentiles"] for q in required):
+            return entry["stats"]
+
+        # keep the percentiles an up-to-date entry already has, so requests for different ones do not alternate
+        if valid:
+            required += [float(q) for q in entry["stats"]["percentiles"]]
+        required = sorted({f"{q:g}": q for q in required}.values())
+        im = load() if load is not None else tifffile.imread(path)
+        stats = compute_marker_stats(im, percentiles=required, n_bins=self.n_bins)
+        with self._lock:
+            self._entries[path] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "n_bins": self.n_bins,
+                "stats": stats,
+            }
+            self._save()
+        return stats
+
+
+_STATS_STORES = {}
+_STATS_STORES_LOCK = threading.Lock()
+
+
+def get_marker_stats_store(path: Optional[str] = None) -> MarkerStatsStore:
+    """
+    Get the process-wide marker statistics store for a path, creating it on first use.
+
+    Args:
+        path (str, optional): Path to the JSON file persisting the statistics. Defaults to None, the in-memory store.
+
+    Returns:
+        MarkerStatsStore: The store shared by all `MarkerDict` objects in this process using the same path.
+    """
+    key = os.path.abspath(path) if path is not None else None
+    with _STATS_STORES_LOCK:
+        if key not in _STATS_STORES:
+            _STATS_STORES[key] = MarkerStatsStore(key)
+        return _STATS_STORES[key]
@@ -1,11 +1,17 @@
 import re
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 
+import numpy as np
 import pandas as pd
-import tifffile
 from IPython.display import display
-from tifffile import tifffile
 from tqdm import tqdm
 
+from pycodex import io, markerstats
+
 ########################################################################################################################
 # summary marker
 ########################################################################################################################
@@ -23,29 +29,37 @@ def summary_markers(
     Returns:
         tuple: Lists of unique markers, blank markers, duplicated markers, and markers missing in some regions.
     """
+    metadata_dict = io.as_metadata_dict(metadata_dict)
+
     # Get All unique markers
-    combined_metadata_df = pd.concat(metadata_dict.values(), ignore_index=True)
-    all_markers = combined_metadata_df["marker"].unique()
+    all_markers = list(
+        dict.fromkeys(marker for region in metadata_dict for marker in metadata_dict.marker_index(region))
+    )
 
     # Identify and filter out blank markers
     blank_markers = [marker for marker in all_markers if re.match(r"blank", marker, re.IGNORECASE)]
-    metadata_df = combined_metadata_df.loc[~combined_metadata_df["marker"].isin(blank_markers)]
-    count_pivot = metadata_df.pivot_table(index="marker", columns="region", aggfunc="size", fill_value=0)
+    blank_set = set(blank_markers)
+    region_counts = {
+        region: {marker: len(rows) for marker, rows in metadata_dict.marker_index(region).items()}
+        for region in metadata_dict
+    }
+    # regions holding only blank markers do not count towards missing markers
+    regions = [region for region, counts in region_counts.items() if set(counts) - blank_set]
+    non_blank_markers = sorted(set(all_markers) - blank_set)
 
     # Identify markers that are missing in some regions
-    missing_markers_n = (count_pivot == 0).sum(axis=1)
-    missing_markers_df = count_pivot.loc[missing_markers_n > 0]
-    missing_markers = list(missing_markers_df.index)
+    missing_markers = [
+        marker for marker in non_blank_markers if any(marker not in region_counts[region] for region in regions)
+    ]
 
     # Identify markers that are duplicated in some regions
-    duplicated_markers_n = (count_pivot > 1).sum(axis=1)
-    duplicated_markers_df = count_pivot.loc[duplicated_markers_n > 0]
-    duplicated_markers = list(duplicated_markers_df.index)
+    duplicated_markers = [
+        marker for marker in non_blank_markers if any(region_counts[region].get(marker, 0) > 1 for region in regions)
+    ]
 
     # Identify unique markers (not blank, not duplicated, and not missing in any region)
-    unique_markers = [
-        marker for marker in all_markers if marker not in (blank_markers + duplicated_markers + missing_markers)
-    ]
+    excluded_markers = blank_set | set(duplicated_markers) | set(missing_markers)
+    unique_markers = [marker for marker in all_markers if marker not in excluded_markers]
     unique_markers = sorted(unique_markers)
 
     # Display summary information
@@ -65,7 +79,181 @@ def summary_markers(
 ########################################################################################################################
 
 
-def organize_marker_dict(metadata_dict: dict[str, pd.DataFrame], region: str, marker_list: list[str]):
+class MarkerDict(MutableMapping):
+    """
+    Dictionary-like container of marker images that decodes each image on first access.
+
+    Decoded images are kept in a least-recently-used cache bounded by `max_cache_bytes`; an evicted marker is decoded
+    again from its path on the next access. Images assigned with `marker_dict[marker] = im` are kept in memory and
+    never evicted. It can be used wherever a `dict[str, np.ndarray]` of marker images is accepted.
+
+    Args:
+        marker_paths (dict): Dictionary containing marker names as keys and image paths as values.
+        max_cache_bytes (int, optional): Maximum bytes of decoded images to keep in memory, None for no limit.
+            The most recently accessed image is always kept. Defaults to 4 GB.
+        stats_store (MarkerStatsStore, optional): Store of per-file marker statistics used by `stats`.
+            Defaults to None, which uses the process-wide in-memory store (nothing is written to disk).
+        mmap (bool, optional): Whether to memory-map eligible (uncompressed) TIFFs instead of decoding them, see
+            `io.imread_marker`. Memory-mapped images do not count towards `max_cache_bytes`. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        marker_paths: dict[str, str],
+        max_cache_bytes: Optional[int] = 4 * 1024**3,
+        stats_store: Optional[markerstats.MarkerStatsStore] = None,
+        mmap: bool = False,
+    ):
+        self._paths = dict(marker_paths)
+        self.mmap = mmap
+        self.stats_store = stats_store if stats_store is not None else markerstats.get_marker_stats_store()
+        self._pinned = {}
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self.max_cache_bytes = max_cache_bytes
+        self._lock = threading.RLock()
+
+    @property
+    def paths(self) -> dict[str, str]:
+        """dict: Image paths of the markers that are loaded from disk."""
+        return {marker: path for marker, path in self._paths.items() if marker not in self._pinned}
+
+    @property
+    def cache_bytes(self) -> int:
+        """int: Bytes of decoded images currently held in the cache."""
+        return self._cache_bytes
+
+    def stats(self, marker: str, percentiles: Optional[list[float]] = None) -> dict:
+        """
+        Get intensity statistics of a marker (min, max, mean, percentiles, histogram) without rescanning its pixels.
+
+        Statistics of markers loaded from disk come from the persistent `stats_store` and are computed only the first
+        time a file is seen, or again when `percentiles` asks for ones it does not have yet; statistics of assigned
+        images are computed from the image.
+
+        Args:
+            marker (str): Marker name.
+            percentiles (list, optional): Percentiles needed besides the store's default ones. Defaults to None.
+
+        Returns:
+            dict: Marker statistics from `markerstats.compute_marker_stats`.
+        """
+        if marker in self._pinned:
+            return markerstats.compute_marker_stats(
+                self._pinned[marker],
+                percentiles=[*self.stats_store.percentiles, *(percentiles or [])],
+                n_bins=self.stats_store.n_bins,
+            )
+        if marker not in self._paths:
+            raise KeyError(marker)
+        return self.stats_store.get(self._paths[marker], load=lambda: self[marker], percentiles=percentiles)
+
+    def read_window(self, marker: str, x_min: int, x_max: int, y_min: int, y_max: int) -> np.ndarray:
+        """
+        Read a window of a marker, decoding only the part of the file that overlaps it.
+
+        A marker that is already in memory is sliced instead; the window is not added to the cache.
+
+        Args:
+            marker (str): Marker name.
+            x_min (int): Minimum x-coordinate of the window.
+            x_max (int): Maximum x-coordinate of the window (exclusive).
+            y_min (int): Minimum y-coordinate of the window.
+            y_max (int): Maximum y-coordinate of the window (exclusive).
+
+        Returns:
+            np.ndarray: Window of the marker image.
+        """
+        with self._lock:
+            im = self._pinned.get(marker, self._cache.get(marker))
+            if im is None and marker not in self._paths:
+                raise KeyError(marker)
+        if im is not None:
+            return im[y_min:y_max, x_min:x_max]
+        return io.imread_window(self._paths[marker], x_min, x_max, y_min, y_max)
+
+    def _load(self, marker: str) -> np.ndarray:
+        return io.imread_marker(self._paths[marker], mmap=self.mmap)
+
+    @staticmethod
+    def _nbytes(im: np.ndarray) -> int:
+        # memory-mapped images live in the page cache, not on the heap
+        return 0 if isinstance(im, np.memmap) else im.nbytes
+
+    def _evict(self) -> None:
+        if self.max_cache_bytes is None:
+            return
+        while self._cache_bytes > self.max_cache_bytes and len(self._cache) > 1:
+            _, im = self._cache.popitem(last=False)
+            self._cache_bytes -= self._nbytes(im)
+
+    def __getitem__(self, marker: str) -> np.ndarray:
+        with self._lock:
+            if marker in self._pinned:
+                return self._pinned[marker]
+            if marker in self._cache:
+                self._cache.move_to_end(marker)
+                return self._cache[marker]
+            if marker not in self._paths:
+                raise KeyError(marker)
+
+        # decode outside the lock so that several markers can be decoded concurrently
+        im = self._load(marker)
+        with self._lock:
+            if marker not in self._cache:
+                self._cache[marker] = im
+                self._cache_bytes += self._nbytes(im)
+            self._cache.move_to_end(marker)
+            self._evict()
+            return self._cache[marker]
+
+    def __setitem__(self, marker: str, im: np.ndarray) -> None:
+        with self._lock:
+            self._discard_cached(marker)
+            self._pinned[marker] = im
+
+    def __delitem__(self, marker: str) -> None:
+        with self._lock:
+            if marker not in self._pinned and marker not in self._paths:
+                raise KeyError(marker)
+            self._discard_cached(marker)
+            self._pinned.pop(marker, None)
+            self._paths.pop(marker, None)
+
+    def _discard_cached(self, marker: str) -> None:
+        im = self._cache.pop(marker, None)
+        if im is not None:
+            self._cache_bytes -= self._nbytes(im)
+
+    def __iter__(self) -> Iterator[str]:
+        markers = list(self._paths) + [marker for marker in self._pinned if marker not in self._paths]
+        return iter(markers)
+
+    def __len__(self) -> int:
+        return len(self._paths) + len([marker for marker in self._pinned if marker not in self._paths])
+
+    def __contains__(self, marker: object) -> bool:
+        return marker in self._paths or marker in self._pinned
+
+    def __repr__(self) -> str:
+        return (
+            f"MarkerDict({len(self)} markers, {len(self._cache)} cached, "
+            f"{self._cache_bytes / 1024**2:.1f} MB / "
+            f"{'unlimited' if self.max_cache_bytes is None else f'{self.max_cache_bytes / 1024**2:.1f} MB'})"
+        )
+
+
+def organize_marker_dict(
+    metadata_dict: dict[str, pd.DataFrame],
+    region: str,
+    marker_list: list[str],
+    lazy: bool = False,
+    max_cache_bytes: Optional[int] = 4 * 1024**3,
+    mmap: bool = False,
+    n_workers: int = 1,
+    maxworkers_per_file: Optional[int] = None,
+    stats_path: Optional[str] = None,
+):
     """
     Organize marker dictionary for a specific region.
 
@@ -73,16 +261,81 @@ def organize_marker_dict(metadata_dict: dict[str, pd.DataFrame], region: str, ma
         metadata_dict (dict): Dictionary containing region names as keys and metadata DataFrames as values.
         region (str): Name of the region to extract markers for.
         marker_list (list): List of marker names to organize.
+        lazy (bool, optional): Whether to return a `MarkerDict` that decodes markers on first access instead of
+            loading all of them up front. Defaults to False.
+        max_cache_bytes (int, optional): Cache size of the `MarkerDict` in bytes when `lazy` is True.
+            Defaults to 4 GB.
+        mmap (bool, optional): Whether to memory-map eligible (uncompressed) TIFFs read-only instead of decoding
+            them, see `io.imread_marker`. Defaults to False.
+        n_workers (int, optional): Number of markers decoded concurrently when `lazy` is False. TIFF decompression
+            releases the GIL, so threads scale with the number of cores. Defaults to 1.
+        maxworkers_per_file (int, optional): Maximum number of threads decoding the tiles or strips of each file.
+            Defaults to None, which lets tifffile decide; use 1 when `n_workers` already covers the cores.
+        stats_path (str, optional): JSON file persisting the marker statistics of the `MarkerDict` when `lazy` is
+            True, see `markerstats.MarkerStatsStore`. Defaults to None, which keeps them in memory only.
 
     Returns:
         dict: Dictionary containing marker names as keys and marker images as values for a specific region.
+
+    Raises:
+        RuntimeError: If any marker fails to load, listing the error of each failed marker.
+    """
+    metadata_dict = io.as_metadata_dict(metadata_dict)
+    marker_paths = {marker: metadata_dict.marker_path(region, marker) for marker in marker_list}
+    if lazy:
+        stats_store = markerstats.get_marker_stats_store(stats_path)
+        return MarkerDict(marker_paths, max_cache_bytes=max_cache_bytes, stats_store=stats_store, mmap=mmap)
+
+    marker_dict = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {}
+        for marker, marker_path in marker_paths.items():
+            futures[marker] = executor.submit(io.imread_marker, marker_path, mmap, maxworkers_per_file)
+        # collect in marker order so the dictionary order does not depend on decoding order
+        for marker, future in tqdm(futures.items(), total=len(futures)):
+            try:
+                marker_dict[marker] = future.result()
+            except Exception as e:
+                errors[marker] = e
+    if errors:
+        message = "; ".join(f"'{marker}': {error}" for marker, error in errors.items())
+        raise RuntimeError(f"Failed to load {len(errors)} marker(s) of region '{region}': {message}")
+    return marker_dict
+
+
+def organize_marker_dict_subregion(
+    metadata_dict: dict[str, pd.DataFrame],
+    region: str,
+    marker_list: list[str],
+    x_min: int,
+    x_max: int,
+    y_min: int,
+    y_max: int,
+) -> dict[str, np.ndarray]:
+    """
+    Organize marker dictionary for a subregion of a specific region, reading only the window from each file.
+
+    Equivalent to `markerim.subset_subregion(organize_marker_dict(...), x_min, x_max, y_min, y_max)`, but only the
+    tiles or strips overlapping the window are decoded (see `io.imread_window`).
+
+    Args:
+        metadata_dict (dict): Dictionary containing region names as keys and metadata DataFrames as values.
+        region (str): Name of the region to extract markers for.
+        marker_list (list): List of marker names to organize.
+        x_min (int): Minimum x-coordinate of the subregion.
+        x_max (int): Maximum x-coordinate of the subregion.
+        y_min (int): Minimum y-coordinate of the subregion.
+        y_max (int): Maximum y-coordinate of the subregion.
+
+    Returns:
+        dict: Dictionary containing marker names as keys and cropped marker images as values.
     """
+    metadata_dict = io.as_metadata_dict(metadata_dict)
     marker_dict = {}
-    metadata_df = metadata_dict[region]
-    for marker in tqdm(marker_list):
-        # print(marker)
-        marker_path = metadata_df["path"][metadata_df["marker"] == marker].item()
-        marker_dict[marker] = tifffile.imread(marker_path)
+    for marker in marker_list:
+        marker_path = metadata_dict.marker_path(region, marker)
+        marker_dict[marker] = io.imread_window(marker_path, x_min, x_max, y_min, y_max)
     return marker_dict
 
 
@@ -101,7 +354,16 @@ def display_pixel_size(metadata_dict: dict[str, pd.DataFrame], n: int = 1) -> No
 
     Returns:
     None: Displays a DataFrame of unique pixel sizes (width or height in micrometers) found in the TIFF files.
+
+    If the metadata has header columns (see `io.read_tiff_headers`), the pixel sizes of all files are taken from them
+    and no file is opened; `n` is then ignored.
     """
+    if all({"pixel_width_um", "pixel_height_um"} <= set(metadata_df.columns) for metadata_df in metadata_dict.values()):
+        size_df = pd.concat(metadata_dict.values(), ignore_index=True)
+        size_df = size_df[["pixel_width_um", "pixel_height_um"]].drop_duplicates()
+        display(size_df)
+        return
+
     from pycodex.utils import get_tiff_size
 
     path_list = [path for metadata_df in metadata_dict.values() for path in metadata_df.iloc[:n]["path"]]
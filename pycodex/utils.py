@@ -1,7 +1,16 @@
+import datetime
+import hashlib
 import json
 import logging
+import multiprocessing
 import os
+import queue
+import threading
+import time
 from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
 
 import numpy as np
 import pandas as pd
@@ -10,7 +19,7 @@ from IPython.display import display
 from tifffile import tifffile
 from tqdm import tqdm
 
-from pycodex import crop, markerim, metadata
+from pycodex import crop, io, markerim, metadata
 
 ########################################################################################################################
 # tiff
@@ -30,25 +39,11 @@ def get_tiff_size(tiff_path: str) -> dict[str, float]:
     """
     with tifffile.TiffFile(tiff_path) as tif:
         page = tif.pages[0]  # Assuming single-page TIFF
-
-        # Get resolution unit
-        res_unit = page.tags.get("ResolutionUnit", None)
-        if res_unit is None or res_unit.value == 2:  # 2 means inch
-            unit_scale = 25400  # Convert inches to micrometers
-        elif res_unit.value == 3:  # 3 means centimeter
-            unit_scale = 10000  # Convert centimeters to micrometers
-        else:
-            raise ValueError("Unsupported resolution unit")
-
-        # Get resolution values
-        x_res = page.tags["XResolution"].value[0] / page.tags["XResolution"].value[1]
-        y_res = page.tags["YResolution"].value[0] / page.tags["YResolution"].value[1]
+        pixel_width_um, pixel_height_um = io.get_pixel_size_um(page)
 
         # Calculate size
         width_px = page.imagewidth
         height_px = page.imagelength
-        pixel_width_um = unit_scale / x_res
-        pixel_height_um = unit_scale / y_res
         width_um = width_px * pixel_width_um
         height_um = height_px * pixel_height_um
         size_dict = {
@@ -91,6 +86,630 @@ def display_items(items: list[str], ncol: int = 10) -> None:
 ################################################################################
 
 
+def estimate_region_memory(
+    metadata_df: pd.DataFrame,
+    marker_list: list[str],
+    bytes_per_pixel: int = 96,
+) -> int:
+    """
+    Estimate the peak memory of segmenting one region from the TIFF headers of its markers.
+
+    The estimate is the decoded size of the given markers plus `bytes_per_pixel` for every pixel of the region, which
+    covers the Mesmer input and predictions, the RGB image and overlay, and the feature-extraction temporaries.
+
+    Args:
+        metadata_df (pd.DataFrame): Metadata DataFrame of the region.
+        marker_list (list): Markers held in memory at the same time (e.g. boundary and internal markers).
+        bytes_per_pixel (int, optional): Working memory per pixel on top of the markers. Defaults to 96.
+
+    Returns:
+        int: Estimated peak memory in bytes.
+    """
+    marker_bytes = 0
+    n_pixel = 0
+    for path in metadata_df.loc[metadata_df["marker"].isin(marker_list), "path"]:
+        with tifffile.TiffFile(path) as tif:
+            page = tif.pages[0]
+            marker_bytes += int(np.prod(page.shape)) * page.dtype.itemsize
+            n_pixel = max(n_pixel, page.imagewidth * page.imagelength)
+    return marker_bytes + n_pixel * bytes_per_pixel
+
+
+class _SegmentationManifest:
+    """
+    Completion manifest of a batch segmentation run, saved as `segmentation_manifest.json` in the output directory.
+
+    For every region it records the status, a fingerprint (path, size, mtime) of each input marker and the size, mtime
+    and SHA-256 checksum of each output file, together with a hash of the segmentation parameters. A region is
+    complete when it finished with the same parameters and inputs, and its outputs are intact: outputs with the
+    recorded size and mtime are taken as unchanged, and only the others are hashed and compared to their checksums.
+
+    Args:
+        output_dir (str): Directory for segmentation output files.
+        config (dict): Segmentation parameters of the run.
+    """
+
+    file_name = "segmentation_manifest.json"
+
+    def __init__(self, output_dir: str, config: dict):
+        self.path = os.path.join(output_dir, self.file_name)
+        self.parameters_hash = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+        self._lock = threading.Lock()
+        self.regions = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.regions = json.load(file).get("regions", {})
+
+    @staticmethod
+    def fingerprint(paths: list[str]) -> list[dict]:
+        """
+        Fingerprint files by path, size and modification time.
+
+        Args:
+            paths (list): Paths of the files.
+
+        Returns:
+            list: One dictionary with "path", "size" and "mtime" per file, sorted by path.
+        """
+        fingerprint = []
+        for path in sorted(paths):
+            stat = os.stat(path)
+            fingerprint.append({"path": path, "size": stat.st_size, "mtime": stat.st_mtime})
+        return fingerprint
+
+    @staticmethod
+    def checksum(path: str) -> str:
+        """
+        Compute the SHA-256 checksum of a file, reading it in 1 MB chunks.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            str: Hexadecimal SHA-256 digest.
+        """
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024**2), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @classmethod
+    def output_record(cls, path: str) -> dict:
+        """
+        Record the size, modification time and checksum of an output file.
+
+        Args:
+            path (str): Path of the output file.
+
+        Returns:
+            dict: Dictionary with "size", "mtime" and "sha256".
+        """
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": cls.checksum(path)}
+
+    @classmethod
+    def output_intact(cls, path: str, record: dict) -> bool:
+        """
+        Check that an output file still matches its record, hashing it only if its mtime changed.
+
+        Args:
+            path (str): Path of the output file.
+            record (dict): Record from `output_record`.
+
+        Returns:
+            bool: Whether the file exists and matches the record.
+        """
+        if not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size != record["size"]:
+            return False
+        return stat.st_mtime == record["mtime"] or cls.checksum(path) == record["sha256"]
+
+    def is_complete(self, region: str, input_paths: list[str]) -> bool:
+        """
+        Check whether a region finished with the current parameters and inputs and its outputs are intact.
+
+        Outputs recorded as a bare checksum by earlier versions, or whose mtime changed, are hashed once and, if intact,
+        their record is updated so that later runs only compare sizes and mtimes.
+
+        Args:
+            region (str): Region name.
+            input_paths (list): Paths of the input markers of the region.
+
+        Returns:
+            bool: Whether the region can be skipped.
+        """
+        entry = self.regions.get(region)
+        if entry is None or entry["status"] != "complete" or entry["parameters_hash"] != self.parameters_hash:
+            return False
+        try:
+            if entry["inputs"] != self.fingerprint(input_paths):
+                return False
+            outputs = {}
+            for path, record in entry["outputs"].items():
+                if isinstance(record, str):
+                    if not os.path.exists(path) or self.checksum(path) != record:
+                        return False
+                    stat = os.stat(path)
+                    record = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": record}
+                elif not self.output_intact(path, record):
+                    return False
+                else:
+                    # an output touched without being changed is hashed once, then known by its new mtime
+                    record = {**record, "mtime": os.stat(path).st_mtime}
+                outputs[path] = record
+        except OSError:
+            return False
+        if outputs != entry["outputs"]:
+            with self._lock:
+                entry["outputs"] = outputs
+                self._save()
+        return True
+
+    def record(
+        self,
+        region: str,
+        input_paths: list[str],
+        output_paths: Optional[list[str]] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """
+        Record the outcome of a region and save the manifest.
+
+        Args:
+            region (str): Region name.
+            input_paths (list): Paths of the input markers of the region.
+            output_paths (list, optional): Paths of the written files. Defaults to None.
+            error (Exception, optional): Error the region failed with, None if it completed. Defaults to None.
+
+        Returns:
+            None: Save the manifest in the output directory.
+        """
+        try:
+            inputs = self.fingerprint(input_paths)
+        except OSError:
+            inputs = []
+        entry = {
+            "status": "failed" if error is not None else "complete",
+            "parameters_hash": self.parameters_hash,
+            "inputs": inputs,
+            "outputs": {path: self.output_record(path) for path in output_paths or []},
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+            "updated": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self.regions[region] = entry
+            self._save()
+
+    def _save(self) -> None:
+        """
+        Save the manifest atomically.
+
+        Returns:
+            None: Save the manifest in the output directory.
+        """
+        # write to a temporary file first so that an interrupted run never leaves a truncated manifest
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"parameters_hash": self.parameters_hash, "regions": self.regions}, file, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+def _load_region(
+    metadata_dict: dict[str, pd.DataFrame],
+    region: str,
+    unique_markers: list[str],
+    prefetch_markers: Optional[list[str]] = None,
+    mmap: bool = False,
+    stats_path: Optional[str] = None,
+) -> metadata.MarkerDict:
+    """
+    Index the markers of one region and optionally decode some of them ahead of use.
+
+    Args:
+        metadata_dict (dict): Dictionary containing region names as keys and metadata DataFrames as values.
+        region (str): Region to load.
+        unique_markers (list): Markers to index.
+        prefetch_markers (list, optional): Markers to decode now, in order, as long as they fit in the cache of the
+            `MarkerDict`. Defaults to None, which decodes nothing.
+        mmap (bool, optional): Whether to memory-map eligible TIFFs instead of decoding them. Defaults to False.
+        stats_path (str, optional): JSON file persisting marker statistics. Defaults to None (in memory only).
+
+    Returns:
+        MarkerDict: Lazy marker dictionary of the region.
+    """
+    marker_dict = metadata.organize_marker_dict(
+        metadata_dict, region, unique_markers, lazy=True, mmap=mmap, stats_path=stats_path
+    )
+    for marker in prefetch_markers or []:
+        im = marker_dict[marker]
+        # stop before the next marker would push the first ones out of the cache again
+        if (
+            marker_dict.max_cache_bytes is not None
+            and marker_dict.cache_bytes + im.nbytes > marker_dict.max_cache_bytes
+        ):
+            break
+    logging.info(f"{region}: Markers indexed")
+    return marker_dict
+
+
+def _write_pyramid(path: str, im: np.ndarray, compression: str = "zlib", tile_size: int = 512) -> None:
+    """
+    Write an image as a tiled, compressed TIFF with 2x downsampled pyramid levels in SubIFDs.
+
+    Args:
+        path (str): Output path.
+        im (np.ndarray): Image of shape (height, width) or (height, width, channels).
+        compression (str, optional): TIFF compression. Defaults to "zlib".
+        tile_size (int, optional): Tile size; levels are added until the image is smaller than a tile. Defaults to 512.
+
+    Returns:
+        None: Save the pyramid to `path`.
+    """
+    n_levels = 0
+    while min(im.shape[:2]) // 2 ** (n_levels + 1) >= tile_size:
+        n_levels += 1
+    options = {"tile": (tile_size, tile_size), "compression": compression}
+    with tifffile.TiffWriter(path, bigtiff=True) as tif:
+        tif.write(im, subifds=n_levels, **options)
+        for level in range(1, n_levels + 1):
+            tif.write(im[:: 2**level, :: 2**level], subfiletype=1, **options)
+
+
+def _write_region(output_dir: str, region: str, results: dict, overlay_pyramid: bool = False) -> list[str]:
+    """
+    Write the segmentation outputs of one region.
+
+    Args:
+        output_dir (str): Directory for segmentation output files.
+        region (str): Region the outputs belong to.
+        results (dict): Segmentation mask, RGB image and overlay (None if not rendered), and single-cell feature
+            tables.
+        overlay_pyramid (bool, optional): Whether to write the RGB image and overlay as compressed pyramids.
+            Defaults to False.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    output_subdir = os.path.join(output_dir, region)
+    os.makedirs(output_subdir, exist_ok=True)
+    written = []
+
+    path = os.path.join(output_subdir, "segmentation_mask.tiff")
+    tifffile.imwrite(path, results["segmentation_mask"].astype(np.uint32))
+    written.append(path)
+    for name, file in [("rgb_image", "rgb_image.tiff"), ("overlay", "overlay.tiff")]:
+        if results[name] is None:
+            continue
+        path = os.path.join(output_subdir, file)
+        if overlay_pyramid:
+            _write_pyramid(path, results[name])
+        else:
+            tifffile.imwrite(path, results[name])
+        written.append(path)
+    for name, file in [("data", "data.csv"), ("data_scale_size", "dataScaleSize.csv")]:
+        path = os.path.join(output_subdir, file)
+        results[name].to_csv(path)
+        written.append(path)
+    return written
+
+
+def _segment_region(
+    output_dir: str,
+    metadata_dict: dict[str, pd.DataFrame],
+    region: str,
+    unique_markers: list[str],
+    segmentation_kwargs: dict,
+    session: Optional[markerim.MesmerSession] = None,
+    overlay_pyramid: bool = False,
+    mmap: bool = False,
+    stats_path: Optional[str] = None,
+    feature_memory_budget_mb: Optional[float] = None,
+) -> list[str]:
+    """
+    Segment one region and write its mask, RGB image, overlay and single-cell features.
+
+    Args:
+        output_dir (str): Directory for segmentation output files.
+        metadata_dict (dict): Dictionary containing region names as keys and metadata DataFrames as values.
+        region (str): Region to segment.
+        unique_markers (list): Markers to extract single-cell features for.
+        segmentation_kwargs (dict): Keyword arguments passed to `markerim.segmentation_mesmer`.
+        session (MesmerSession, optional): Mesmer session; None for the process-wide default session.
+        overlay_pyramid (bool, optional): Whether to write the RGB image and overlay as compressed pyramids.
+            Defaults to False.
+        mmap (bool, optional): Whether to memory-map eligible TIFFs instead of decoding them. Defaults to False.
+        stats_path (str, optional): JSON file persisting marker statistics. Defaults to None (in memory only).
+        feature_memory_budget_mb (float, optional): Memory budget of single-cell feature extraction in MB, see
+            `markerim.extract_cell_features`. Defaults to None (whole mask at once).
+
+    Returns:
+        list: Paths of the written files.
+    """
+    marker_dict = _load_region(metadata_dict, region, unique_markers, mmap=mmap, stats_path=stats_path)
+
+    # segmentation
+    segmentation_mask, rgb_image, overlay = markerim.segmentation_mesmer(
+        marker_dict=marker_dict, session=session, **segmentation_kwargs
+    )
+    logging.info(f"{region}: Segmentation completed")
+
+    # single-cell features
+    data, data_scale_size = markerim.extract_cell_features(
+        marker_dict, segmentation_mask, memory_budget_mb=feature_memory_budget_mb
+    )
+    logging.info(f"{region}: Single-cell features extraction completed")
+
+    results = {
+        "segmentation_mask": segmentation_mask,
+        "rgb_image": rgb_image,
+        "overlay": overlay,
+        "data": data,
+        "data_scale_size": data_scale_size,
+    }
+    return _write_region(output_dir, region, results, overlay_pyramid=overlay_pyramid)
+
+
+def _segment_regions_pipeline(
+    output_dir: str,
+    metadata_dict: dict[str, pd.DataFrame],
+    regions: list[str],
+    unique_markers: list[str],
+    segmentation_kwargs: dict,
+    session: markerim.MesmerSession,
+    on_done: Callable[[str, Optional[list[str]], Optional[Exception]], None],
+    overlay_pyramid: bool = False,
+    mmap: bool = False,
+    stats_path: Optional[str] = None,
+    feature_memory_budget_mb: Optional[float] = None,
+    queue_size: int = 1,
+) -> dict[str, float]:
+    """
+    Segment regions in a staged pipeline: load -> segment -> extract -> write.
+
+    A loader thread decodes the markers of the next regions while the current region is segmented and its features
+    extracted in this thread, and a writer thread saves finished regions. Bounded queues between the stages keep at
+    most `queue_size` regions waiting at each hand-over, so memory stays bounded by a few regions.
+
+    Args:
+        output_dir (str): Directory for segmentation output files.
+        metadata_dict (dict): Dictionary containing region names as keys and metadata DataFrames as values.
+        regions (list): List of regions to perform segmentation.
+        unique_markers (list): Markers to extract single-cell features for.
+        segmentation_kwargs (dict): Keyword arguments passed to `markerim.segmentation_mesmer`.
+        session (MesmerSession): Mesmer session to run the model with.
+        on_done (Callable): Called with the region, the written paths (None on failure) and the error (None on
+            success) when a region finishes.
+        overlay_pyramid (bool, optional): Whether to write the RGB image and overlay as compressed pyramids.
+            Defaults to False.
+        mmap (bool, optional): Whether to memory-map eligible TIFFs instead of decoding them. Defaults to False.
+        stats_path (str, optional): JSON file persisting marker statistics. Defaults to None (in memory only).
+        feature_memory_budget_mb (float, optional): Memory budget of single-cell feature extraction in MB, see
+            `markerim.extract_cell_features`. Defaults to None (whole mask at once).
+        queue_size (int, optional): Capacity of the queues between stages. Defaults to 1.
+
+    Returns:
+        dict: Busy seconds and utilisation (busy time / wall time) of each stage, and the total wall time.
+    """
+    stages = ["load", "segment", "extract", "write"]
+    busy = {stage: 0.0 for stage in stages}
+    load_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    prefetch_markers = segmentation_kwargs["boundary_markers"] + segmentation_kwargs["internal_markers"]
+    prefetch_markers += [marker for marker in unique_markers if marker not in prefetch_markers]
+
+    def _loader() -> None:
+        for region in regions:
+            start = time.perf_counter()
+            try:
+                item = (
+                    region,
+                    _load_region(metadata_dict, region, unique_markers, prefetch_markers, mmap, stats_path),
+                    None,
+                )
+            except Exception as e:
+                item = (region, None, e)
+            busy["load"] += time.perf_counter() - start
+            load_queue.put(item)
+        load_queue.put(None)
+
+    def _writer() -> None:
+        while (item := write_queue.get()) is not None:
+            region, results = item
+            start = time.perf_counter()
+            try:
+                written = _write_region(output_dir, region, results, overlay_pyramid=overlay_pyramid)
+            except Exception as e:
+                busy["write"] += time.perf_counter() - start
+                on_done(region, None, e)
+                continue
+            busy["write"] += time.perf_counter() - start
+            on_done(region, written, None)
+
+    wall_start = time.perf_counter()
+    loader = threading.Thread(target=_loader, daemon=True)
+    writer = threading.Thread(target=_writer, daemon=True)
+    loader.start()
+    writer.start()
+
+    progress = tqdm(total=len(regions))
+    while (item := load_queue.get()) is not None:
+        region, marker_dict, error = item
+        try:
+            if error is not None:
+                raise error
+
+            start = time.perf_counter()
+            segmentation_mask, rgb_image, overlay = markerim.segmentation_mesmer(
+                marker_dict=marker_dict, session=session, **segmentation_kwargs
+            )
+            busy["segment"] += time.perf_counter() - start
+            logging.info(f"{region}: Segmentation completed")
+
+            start = time.perf_counter()
+            data, data_scale_size = markerim.extract_cell_features(
+                marker_dict, segmentation_mask, memory_budget_mb=feature_memory_budget_mb
+            )
+            busy["extract"] += time.perf_counter() - start
+            logging.info(f"{region}: Single-cell features extraction completed")
+
+            results = {
+                "segmentation_mask": segmentation_mask,
+                "rgb_image": rgb_image,
+                "overlay": overlay,
+                "data": data,
+                "data_scale_size": data_scale_size,
+            }
+            write_queue.put((region, results))
+        except Exception as e:
+            on_done(region, None, e)
+        finally:
+            del marker_dict
+            progress.update(1)
+    progress.close()
+
+    write_queue.put(None)
+    writer.join()
+    loader.join()
+
+    wall_seconds = time.perf_counter() - wall_start
+    stats = {"wall_seconds": wall_seconds}
+    for stage in stages:
+        stats[f"{stage}_seconds"] = busy[stage]
+        stats[f"{stage}_utilisation"] = busy[stage] / wall_seconds if wall_seconds > 0 else 0.0
+    return stats
+
+
+def _segment_regions_parallel(
+    output_dir: str,
+    metadata_dict: dict[str, pd.DataFrame],
+    regions: list[str],
+    unique_markers: list[str],
+    segmentation_kwargs: dict,
+    n_workers: int,
+    on_done: Callable[[str, Optional[list[str]], Optional[Exception]], None],
+    memory_limit_gb: Optional[float] = None,
+    overlay_pyramid: bool = False,
+    mmap: bool = False,
+    stats_path: Optional[str] = None,
+    feature_memory_budget_mb: Optional[float] = None,
+) -> None:
+    """
+    Segment regions in worker processes, each holding its own Mesmer model.
+
+    With `mmap`, workers memory-map the marker files, so workers reading the same files share physical pages.
+
+    Regions are submitted first-fit: a pending region starts only when a worker is free and its estimated memory
+    (`estimate_region_memory`) fits in what the running regions leave of `memory_limit_gb`. A region that does not
+    fit on its own still runs once no other region is running.
+
+    If a worker dies abruptly (e.g. killed when out of memory), the pool is broken: the regions running at that time
+    and the regions not submitted yet are all reported as failed through `on_done`, then an error is raised.
+
+    Args:
+        output_dir (str): Directory for segmentation output files.
+        metadata_dict (dict): Dictionary containing region names as keys and metadata DataFrames as values.
+        regions (list): List of regions to perform segmentation.
+        unique_markers (list): Markers to extract single-cell features for.
+        segmentation_kwargs (dict): Keyword arguments passed to `markerim.segmentation_mesmer`.
+        n_workers (int): Number of worker processes.
+        on_done (Callable): Called with the region, the written paths (None on failure) and the error (None on
+            success) when a region finishes.
+        memory_limit_gb (float, optional): Memory available to all workers in GB. None for no limit.
+        overlay_pyramid (bool, optional): Whether to write the RGB image and overlay as compressed pyramids.
+            Defaults to False.
+        mmap (bool, optional): Whether to memory-map eligible TIFFs instead of decoding them. Defaults to False.
+        stats_path (str, optional): JSON file persisting marker statistics. Defaults to None (in memory only).
+        feature_memory_budget_mb (float, optional): Memory budget of single-cell feature extraction in MB, see
+            `markerim.extract_cell_features`. Defaults to None (whole mask at once).
+
+    Returns:
+        None: Save the outputs in the output directory.
+
+    Raises:
+        RuntimeError: If the worker pool broke, listing the regions that were running and those not run.
+    """
+    seg_markers = segmentation_kwargs["boundary_markers"] + segmentation_kwargs["internal_markers"]
+    memory_estimate = {}
+    for region in regions:
+        try:
+            memory_estimate[region] = estimate_region_memory(metadata_dict[region], seg_markers)
+        except Exception:
+            # unreadable headers: schedule without an estimate and let the worker report the failure
+            memory_estimate[region] = 0
+    memory_limit = None if memory_limit_gb is None else memory_limit_gb * 1024**3
+
+    pending = list(regions)
+    running = {}
+    broken = None
+    crashed = []
+    progress = tqdm(total=len(regions))
+    # spawn so that workers do not inherit TensorFlow state from the parent process
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context) as executor:
+        while running or (pending and broken is None):
+            while pending and broken is None and len(running) < n_workers:
+                memory_used = sum(memory_estimate[region] for region in running.values())
+                fits = [
+                    region
+                    for region in pending
+                    if memory_limit is None or memory_used + memory_estimate[region] <= memory_limit
+                ]
+                if not fits and running:
+                    break
+                region = fits[0] if fits else pending[0]
+                try:
+                    future = executor.submit(
+                        _segment_region,
+                        output_dir,
+                        {region: metadata_dict[region]},
+                        region,
+                        unique_markers,
+                        segmentation_kwargs,
+                        None,
+                        overlay_pyramid,
+                        mmap,
+                        stats_path,
+                        feature_memory_budget_mb,
+                    )
+                except BrokenProcessPool as e:
+                    broken = e
+                    break
+                pending.remove(region)
+                running[future] = region
+            if not running:
+                break
+
+            # once the pool is broken, every running future fails with BrokenProcessPool
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                region = running.pop(future)
+                try:
+                    written = future.result()
+                except BrokenProcessPool as e:
+                    broken = e
+                    crashed.append(region)
+                    on_done(region, None, e)
+                except Exception as e:
+                    on_done(region, None, e)
+                else:
+                    on_done(region, written, None)
+                progress.update(1)
+
+    if broken is not None:
+        for region in pending:
+            on_done(region, None, RuntimeError(f"Not run: the worker pool broke ({broken})"))
+            progress.update(1)
+    progress.close()
+    if broken is not None:
+        raise RuntimeError(
+            f"The worker pool broke ({broken}); {len(crashed)} running region(s) failed: {crashed}; "
+            f"{len(pending)} region(s) not run: {pending}"
+        )
+
+
 def segmentation_mesmer(
     output_dir: str,
     metadata_dict: dict[str, pd.DataFrame],
@@ -101,6 +720,17 @@ def segmentation_mesmer(
     scale: bool = True,
     maxima_threshold: float = 0.075,
     interior_threshold: float = 0.20,
+    nuclear_thresholds: bool = False,
+    n_workers: int = 1,
+    memory_limit_gb: Optional[float] = None,
+    prefetch: bool = False,
+    resume: bool = True,
+    outputs: str = "all",
+    overlay_downsample: int = 1,
+    overlay_pyramid: bool = False,
+    mmap: bool = False,
+    stats_path: Optional[str] = None,
+    feature_memory_budget_mb: Optional[float] = None,
 ) -> None:
     """
     Perform segmentation (Mesmer) on each image in the marker object.
@@ -115,9 +745,42 @@ def segmentation_mesmer(
         scale (bool, optional): Whether to scale the images or not. Defaults to True.
         maxima_threshold (float, optional): Maxima threshold, larger for fewer cells. Defaults to 0.075.
         interior_threshold (float, optional): Interior threshold, larger for larger cells. Defaults to 0.20.
+        nuclear_thresholds (bool, optional): Whether to apply the maxima and interior thresholds to the nuclear
+            compartment, which is the one segmented (see `markerim.segmentation_mesmer`). Defaults to False, which
+            keeps the nuclear defaults of Mesmer, so the thresholds do not change the masks. Set it to True to apply
+            thresholds chosen with `markerim.sweep_mesmer_thresholds`.
+        n_workers (int, optional): Number of worker processes segmenting regions in parallel, each with its own
+            Mesmer model. Defaults to 1, which processes regions sequentially in this process.
+        memory_limit_gb (float, optional): Memory available to all workers in GB, used to schedule regions by their
+            estimated memory (see `estimate_region_memory`). Defaults to None, which does not limit scheduling.
+        prefetch (bool, optional): With a single worker, run regions through a staged pipeline that loads the next
+            region's markers and writes finished regions in background threads while the current region is segmented.
+            Per-stage utilisation is logged and saved to `pipeline_stats.json`. Defaults to False.
+        resume (bool, optional): Skip regions that `segmentation_manifest.json` in the output directory records as
+            complete with the same parameters, unchanged inputs and intact outputs, and retry only failed or stale
+            ones. Defaults to True.
+        outputs (str, optional): Images to save besides the mask: "mask" for the mask only, "overlay" for the mask and
+            overlay, or "all" for the mask, RGB image and overlay. QC images that are not requested are never rendered.
+            Defaults to "all".
+        overlay_downsample (int, optional): Downsampling factor of the RGB image and overlay. Defaults to 1.
+        overlay_pyramid (bool, optional): Whether to save the RGB image and overlay as tiled, compressed pyramids.
+            Defaults to False.
+        mmap (bool, optional): Whether to memory-map uncompressed marker TIFFs read-only instead of decoding them
+            (see `io.imread_marker`); parallel workers then share the page cache. Defaults to False.
+        stats_path (str, optional): JSON file persisting per-marker intensity statistics across runs, for example
+            `os.path.join(output_dir, "marker_stats.json")`. Defaults to None, which keeps them in memory for this run.
+            Marker directories are never written to.
+        feature_memory_budget_mb (float, optional): Memory budget of single-cell feature extraction in MB. The mask is
+            then aggregated in strips (see `markerim.extract_cell_features`) instead of with about 24 bytes of
+            temporaries per pixel, e.g. 9.6 GB for a 20000 x 20000 mask. The features are the same up to float rounding.
+            Defaults to None, which processes the whole mask at once.
 
     Returns:
-        None: Save segmentation_mask, rgb_image, and overlay in the output directory.
+        None: Save segmentation_mask, rgb_image, and overlay (as requested by `outputs`) in the output directory.
+
+    Raises:
+        RuntimeError: If a worker process died with `n_workers` > 1 (see `_segment_regions_parallel`). The affected
+            regions are recorded as failed, so `resume` retries them.
     """
     os.makedirs(output_dir, exist_ok=True)
 
@@ -129,44 +792,99 @@ def segmentation_mesmer(
         "scale": scale,
         "maxima_threshold": maxima_threshold,
         "interior_threshold": interior_threshold,
+        "nuclear_thresholds": nuclear_thresholds,
+        "outputs": outputs,
+        "overlay_downsample": overlay_downsample,
+        "overlay_pyramid": overlay_pyramid,
     }
     with open(f"{output_dir}/parameter_segmentation.json", "w", encoding="utf-8") as file:
         json.dump(config, file, indent=4, ensure_ascii=False)
 
     unique_markers, _, _, _ = metadata.summary_markers(metadata_dict)
-    for region in tqdm(regions):
-        marker_dict = metadata.organize_marker_dict(metadata_dict, region, unique_markers)
-        logging.info(f"{region}: Markers loaded")
+    segmentation_kwargs = {key: value for key, value in config.items() if key != "overlay_pyramid"}
 
-        try:
-            # segmentation
-            segmentation_mask, rgb_image, overlay = markerim.segmentation_mesmer(
-                boundary_markers=boundary_markers,
-                internal_markers=internal_markers,
-                marker_dict=marker_dict,
-                pixel_size_um=pixel_size_um,
-                scale=scale,
-                maxima_threshold=maxima_threshold,
-                interior_threshold=interior_threshold,
+    # skip regions completed by an earlier run
+    manifest = _SegmentationManifest(output_dir, config)
+    metadata_dict = io.as_metadata_dict(metadata_dict)
+    input_paths = {
+        region: [metadata_dict.marker_path(region, marker) for marker in unique_markers] for region in regions
+    }
+    if resume:
+        completed = [region for region in regions if manifest.is_complete(region, input_paths[region])]
+        if completed:
+            logging.info(f"Skipping {len(completed)} completed regions: {completed}")
+        regions = [region for region in regions if region not in completed]
+
+    def _on_done(region: str, output_paths: Optional[list[str]], error: Optional[Exception]) -> None:
+        if error is not None:
+            logging.error(f"[ERROR] '{region}': Failed to process: {error}")
+        manifest.record(region, input_paths[region], output_paths, error)
+
+    if n_workers > 1:
+        _segment_regions_parallel(
+            output_dir,
+            metadata_dict,
+            regions,
+            unique_markers,
+            segmentation_kwargs,
+            n_workers,
+            _on_done,
+            memory_limit_gb,
+            overlay_pyramid,
+            mmap,
+            stats_path,
+            feature_memory_budget_mb,
+        )
+        return
+
+    session = markerim.get_mesmer_session()
+    if prefetch:
+        stats = _segment_regions_pipeline(
+            output_dir,
+            metadata_dict,
+            regions,
+            unique_markers,
+            segmentation_kwargs,
+            session,
+            _on_done,
+            overlay_pyramid,
+            mmap,
+            stats_path,
+            feature_memory_budget_mb,
+        )
+        logging.info(
+            "Pipeline utilisation: "
+            + ", ".join(
+                f"{stage} {stats[f'{stage}_utilisation']:.0%}" for stage in ["load", "segment", "extract", "write"]
             )
-
-            # save segmentation mask
-            output_subdir = os.path.join(output_dir, region)
-            os.makedirs(output_subdir, exist_ok=True)
-            tifffile.imwrite(os.path.join(output_subdir, "segmentation_mask.tiff"), segmentation_mask.astype(np.uint32))
-            tifffile.imwrite(os.path.join(output_subdir, "rgb_image.tiff"), rgb_image)
-            tifffile.imwrite(os.path.join(output_subdir, "overlay.tiff"), overlay)
-            logging.info(f"{region}: Segmentation completed")
-
-            # save single-cell features
-            data, data_scale_size = markerim.extract_cell_features(marker_dict, segmentation_mask)
-            data.to_csv(os.path.join(output_subdir, "data.csv"))
-            data_scale_size.to_csv(os.path.join(output_subdir, "dataScaleSize.csv"))
-            logging.info(f"{region}: Single-cell features extraction completed")
-
-        except Exception as e:
-            logging.info(f"[ERROR] '{region}': Failed to process: {e}")
-            continue
+        )
+        with open(f"{output_dir}/pipeline_stats.json", "w", encoding="utf-8") as file:
+            json.dump(stats, file, indent=4)
+    else:
+        for region in tqdm(regions):
+            try:
+                written = _segment_region(
+                    output_dir,
+                    metadata_dict,
+                    region,
+                    unique_markers,
+                    segmentation_kwargs,
+                    session=session,
+                    overlay_pyramid=overlay_pyramid,
+                    mmap=mmap,
+                    stats_path=stats_path,
+                    feature_memory_budget_mb=feature_memory_budget_mb,
+                )
+            except Exception as e:
+                _on_done(region, None, e)
+                continue
+            _on_done(region, written, None)
+
+    timing = session.timing_summary()
+    logging.info(
+        f"Mesmer model setup: {timing['setup_seconds']:.1f} s, "
+        f"inference: {timing['inference_seconds']:.1f} s over {timing['n_predictions']} predictions"
+    )
 
 
 ################################################################################
@@ -174,15 +892,25 @@ def segmentation_mesmer(
 ################################################################################
 
 
+_BLOCK_COMPRESSION = {None: None, "none": None, "deflate": "zlib", "zstd": "zstd", "lzw": "lzw"}
+
+
 def crop_image_into_blocks(
-    marker_dir: str, segmentation_dir: str, output_dir: str, regions: list[str], max_block_size=3000
+    marker_dir: str,
+    segmentation_dir: str,
+    output_dir: str,
+    regions: list[str],
+    max_block_size=3000,
+    mmap: bool = False,
+    n_workers: int = 4,
+    compression: Optional[str] = None,
 ):
     """
     Crop large marker and segmentation images into smaller blocks for each region.
 
     This function processes marker images and segmentation masks for multiple regions.
-    It identifies markers with inconsistent shapes, filters them out, and crops the
-    remaining images into smaller blocks. Each block is saved as a separate file.
+    It identifies markers with inconsistent shapes from the TIFF headers, filters them out, and crops the
+    remaining images into smaller blocks, one image at a time. Each block is saved as a separate file.
 
     Args:
         marker_dir (str):
@@ -196,10 +924,26 @@ def crop_image_into_blocks(
         max_block_size (int):
             The maximum allowed size for any block along both dimensions (height and width).
             Defaults to 3000.
+        mmap (bool):
+            Whether to memory-map uncompressed TIFFs read-only instead of decoding them, so that blocks are cropped
+            from page-cache-backed views. Defaults to False.
+        n_workers (int):
+            Number of blocks written concurrently. Defaults to 4.
+        compression (str, optional):
+            Compression of the blocks: None or "none", "deflate", "zstd" or "lzw". "zstd" and "lzw" need the
+            `imagecodecs` package. Defaults to None.
 
     Returns:
         None: The function saves the cropped blocks as TIFF files in the output directory.
     """
+    if compression not in _BLOCK_COMPRESSION:
+        raise ValueError(f"compression must be one of {list(_BLOCK_COMPRESSION)}, got '{compression}'")
+    compression = _BLOCK_COMPRESSION[compression]
+
+    def _write_block(output_path: str, im_sm: np.ndarray) -> int:
+        tifffile.imwrite(output_path, im_sm, compression=compression)
+        return os.path.getsize(output_path)
+
     for region in regions:
         marker_subdir = os.path.join(marker_dir, region)
         marker_files = os.listdir(marker_subdir)
@@ -210,36 +954,51 @@ def crop_image_into_blocks(
         segmentation_path = os.path.join(segmentation_subdir, "segmentation_mask.tiff")
 
         all_paths = marker_paths + [segmentation_path]
+        all_markers = [os.path.splitext(os.path.basename(path))[0] for path in all_paths]
 
-        marker_dict = {}
-        for path in tqdm(all_paths, desc=f"Loading {region}"):
-            marker_name = os.path.splitext(os.path.basename(path))[0]
-            marker_image = tifffile.imread(path)
-            marker_dict[marker_name] = marker_image
-
-        # Get all shapes from marker_dict and track their indices
-        shapes = [image.shape for image in marker_dict.values()]
+        # Get all shapes from the TIFF headers, without decoding any image
+        headers = [io.read_tiff_header(path) for path in all_paths]
+        shapes = [(header["height"], header["width"]) for header in headers]
 
         # Count the occurrences of each shape
         shape_counter = Counter(shapes)
         most_common_shape = shape_counter.most_common(1)[0][0]
-        outlier_markers = [list(marker_dict.keys())[i] for i, shape in enumerate(shapes) if shape != most_common_shape]
+        outlier_markers = [all_markers[i] for i, shape in enumerate(shapes) if shape != most_common_shape]
         print(f"Outlier markers: {outlier_markers}")
 
-        filtered_marker_dict = {marker: image for marker, image in marker_dict.items() if marker not in outlier_markers}
+        filtered_paths = {marker: path for marker, path in zip(all_markers, all_paths) if marker not in outlier_markers}
         xy_limits = crop.crop_image_into_blocks(most_common_shape, max_block_size=max_block_size)
 
         output_subdir = os.path.join(output_dir, region)
         os.makedirs(output_subdir, exist_ok=True)
 
-        fig = crop.plot_block_labels(filtered_marker_dict["segmentation_mask"], xy_limits)
+        fig = crop.plot_block_labels(io.imread_marker(filtered_paths["segmentation_mask"], mmap=mmap), xy_limits)
         fig.savefig(os.path.join(output_subdir, f"{region}_subregions.tiff"))
 
-        for label, (x_beg, x_end, y_beg, y_end) in tqdm(xy_limits.items(), desc=f"Cropping {region}: "):
-            for marker, im in filtered_marker_dict.items():
-                output_subdir = os.path.join(output_dir, region, f"{region}_{label}")
-                os.makedirs(output_subdir, exist_ok=True)
-                output_path = os.path.join(output_subdir, f"{marker}.tiff")
-                dtype = im.dtype.type
-                im_sm = (im[y_beg:y_end, x_beg:x_end]).astype(dtype)
-                tifffile.imwrite(output_path, im_sm)
+        block_dirs = {}
+        for label in xy_limits:
+            block_dirs[label] = os.path.join(output_dir, region, f"{region}_{label}")
+            os.makedirs(block_dirs[label], exist_ok=True)
+
+        # stream one marker at a time: read it, write all of its blocks concurrently, release it
+        start = time.perf_counter()
+        written_bytes = 0
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            for marker, path in tqdm(filtered_paths.items(), desc=f"Cropping {region}: "):
+                im = io.imread_marker(path, mmap=mmap)
+                futures = [
+                    # blocks are views of the marker image, written without copying
+                    executor.submit(
+                        _write_block,
+                        os.path.join(block_dirs[label], f"{marker}.tiff"),
+                        im[y_beg:y_end, x_beg:x_end],
+                    )
+                    for label, (x_beg, x_end, y_beg, y_end) in xy_limits.items()
+                ]
+                written_bytes += sum(future.result() for future in futures)
+                del im
+        elapsed = time.perf_counter() - start
+        print(
+            f"Wrote {written_bytes / 1024**2:.1f} MB in {elapsed:.1f} s "
+            f"({written_bytes / 1024**2 / max(elapsed, 1e-9):.1f} MB/s) for {region}"
+        )